@@ -1,14 +1,54 @@
 import abc
+import array
 import entity
 import env
 import grid
 import numpy as np
+import routing
+import time
+
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+REGISTRY: Dict[str, type] = {}
+"""Agent classes and fleet policies by name, as used in config.yml."""
+
+
+def register(cls: type) -> type:
+    """Class decorator that registers an agent class or fleet policy by its name."""
+    REGISTRY[cls.__name__] = cls
+    return cls
+
+
+def get(name: str) -> type:
+    """Returns the registered agent class or fleet policy with the name."""
+    if name not in REGISTRY:
+        raise ValueError(f"Unknown agent type: {name} (known: {', '.join(sorted(REGISTRY))})")
+    return REGISTRY[name]
+
+
+def create(name: str, n_agents: int, seed: Optional[int] = None) -> "Union[List[Base], FleetPolicy]":
+    """Creates the agents of a registered type for n_agents taxis.
+
+    Agent classes are created once per taxi, with its agent_id, and
+    fleet policies once for all the taxis. The random decisions of the
+    agents are seeded with seed, as with FleetPolicy.seed.
+    """
+    cls = get(name)
+    if issubclass(cls, FleetPolicy):
+        agents = cls(n_taxis=n_agents)
+    else:
+        agents = [cls(agent_id=i) for i in range(n_agents)]
+    as_fleet(agents).seed(seed)
+    return agents
 
-from typing import List
 
 class Base(abc.ABC):
     """Base class for all agents."""
 
+    # Whether the action only depends on the last observation, so that
+    # an environment whose state repeats has stalled.
+    deterministic = False
+
     _last_observation: env.Observation
     
     def see(self, obs: env.Observation) -> None:
@@ -20,27 +60,104 @@ class Base(abc.ABC):
         """Acts based on the last observation and any other information."""
         pass
 
+    def seed(self, seed: Optional[Union[int, np.random.SeedSequence]]) -> None:
+        """Seeds the random decisions of the agent. None seeds them from
+        fresh entropy. Agents without random decisions ignore it."""
+        pass
+
+@register
 class Random(Base):
-    """Baseline agent that randomly chooses an action at each timestep."""
+    """Baseline agent that randomly chooses an action at each timestep.
 
-    def __init__(self, seed: int = None) -> None:
+    The actions are drawn in blocks of BLOCK_SIZE and served from a
+    buffer, which gives the same actions as drawing them one at a time.
+    """
+
+    ACTIONS = np.array([
+        env.Action.UP,
+        env.Action.DOWN,
+        env.Action.LEFT,
+        env.Action.RIGHT,
+        env.Action.STAY,
+        env.Action.PICK_UP,
+        env.Action.DROP_OFF,
+    ], dtype=object)
+
+    BLOCK_SIZE = 4096
+
+    def __init__(self, seed: int = None, agent_id: int = 0) -> None:
+        self.seed(seed)
+
+    def seed(self, seed: Optional[Union[int, np.random.SeedSequence]]) -> None:
         self._rng = np.random.default_rng(seed=seed)
-        self._actions = [
-            env.Action.UP,
-            env.Action.DOWN,
-            env.Action.LEFT,
-            env.Action.RIGHT,
-            env.Action.STAY,
-            env.Action.PICK_UP,
-            env.Action.DROP_OFF,
-        ]
+        self._buffer: List[env.Action] = []
+        self._next = 0
 
     def act(self) -> env.Action:
-        return self._rng.choice(self._actions)
+        if self._next == len(self._buffer):
+            self._buffer = self.ACTIONS[self._rng.integers(len(self.ACTIONS), size=self.BLOCK_SIZE)].tolist()
+            self._next = 0
+        action = self._buffer[self._next]
+        self._next += 1
+        return action
+
+
+class DeadlineExceeded(Exception):
+    """Raised when an agent runs out of time to decide."""
 
 
 class PathBased(Base):
-    """Utility class with path based functions."""
+    """Utility class with path based functions.
+
+    The decisions can be bounded in time with decide. The path searches
+    check the deadline and, when it passes, the agent uses the best
+    path found so far or falls back to its previous path. Without a
+    deadline, the targets are chosen with the distance fields of
+    routing, which are shared by the agents and reused between steps,
+    so only the path to the chosen target is searched.
+    """
+
+    # Deadline, in time.perf_counter seconds, of the current decision.
+    _deadline: Optional[float] = None
+
+    # Path followed after the last decision, used as fallback.
+    _previous_path: Optional[List[grid.Position]] = None
+
+    def decide(self, deadline: Optional[float]) -> Tuple[env.Action, bool]:
+        """Acts like act but returns by the deadline.
+
+        Args:
+            deadline: time.perf_counter value by which the decision must
+                be made. None means no deadline.
+
+        Returns: The action and whether the deadline was missed, in which
+            case the action is the fallback action.
+        """
+        self._deadline = deadline
+        try:
+            return self.act(), False
+        except DeadlineExceeded:
+            return self._fallback_action(), True
+        finally:
+            self._deadline = None
+
+    def _check_deadline(self):
+        if self._deadline is not None and time.perf_counter() > self._deadline:
+            raise DeadlineExceeded()
+
+    def _fallback_action(self) -> env.Action:
+        """Keeps moving along the previous path, or stays if the taxi left it."""
+        path = self._previous_path
+        agent_id = getattr(self, "_agent_id", None)
+        if path is None or agent_id is None:
+            return env.Action.STAY
+        loc = self._last_observation.taxis[agent_id].loc
+        if loc not in path:
+            return env.Action.STAY
+        i = path.index(loc)
+        if i + 1 == len(path):
+            return env.Action.STAY
+        return self._move_action(path[i], path[i + 1])
 
     def _pickup_nearest_passenger(
         self, map: grid.Map, agent_taxi: entity.Taxi, passengers: List[entity.Passenger],
@@ -48,12 +165,48 @@ class PathBased(Base):
         if len(passengers) == 0:
             return env.Action.STAY
 
-        shortest_paths = [
-            self._bfs_with_positions(map, agent_taxi.loc, p.pick_up) 
-            for p in passengers
-        ]
-        path_idx = np.argmin([len(p) for p in shortest_paths])
-        return self._move_in_path_and_act(shortest_paths[path_idx], env.Action.PICK_UP)
+        if self._deadline is not None:
+            # Computing the distance fields cannot be interrupted, so the
+            # passengers are searched one by one until the deadline.
+            shortest_paths = []
+            try:
+                for p in passengers:
+                    shortest_paths.append(self._bfs_with_positions(map, agent_taxi.loc, p.pick_up))
+            except DeadlineExceeded:
+                # Anytime decision with the passengers searched so far.
+                if not shortest_paths:
+                    raise
+            path_idx = np.argmin([len(p) for p in shortest_paths])
+            return self._move_in_path_and_act(shortest_paths[path_idx], env.Action.PICK_UP)
+
+        # The distances to all the passengers come from the cached
+        # distance fields, and only the path to the nearest is searched.
+        path_idx = self._nearest(map, agent_taxi.loc, [p.pick_up for p in passengers])
+        shortest_path = self._bfs_with_positions(map, agent_taxi.loc, passengers[path_idx].pick_up)
+        return self._move_in_path_and_act(shortest_path, env.Action.PICK_UP)
+
+    def _nearest(self, map: grid.Map, source: grid.Position, targets: List[grid.Position]) -> int:
+        """Index of the first of the targets with the shortest path from source."""
+        return int(np.argmin(self._distances(map, [source], targets)[:, 0]))
+
+    def _distances(
+        self, map: grid.Map, sources: List[grid.Position], targets: List[grid.Position],
+    ) -> np.ndarray:
+        """Moves from each source to each target, as a (targets, sources) array.
+
+        Without a deadline the distances come from the distance fields of
+        routing. With a deadline each pair is searched with a BFS, which
+        checks the deadline, as the fields are computed without checks.
+        """
+        if self._deadline is not None:
+            return np.array(
+                [[len(self._bfs_with_positions(map, s, t)) - 1 for s in sources] for t in targets],
+                dtype=np.int32,
+            ).reshape(len(targets), len(sources))
+        distances = routing.cache(map).matrix(sources, targets)
+        if np.any(distances == routing.UNREACHABLE):
+            raise ValueError("No path found")
+        return distances
 
     def _dropoff_current_passenger(self, map: grid.Map, agent_taxi: entity.Taxi) -> env.Action:
         passenger = agent_taxi.has_passenger
@@ -61,10 +214,17 @@ class PathBased(Base):
         return self._move_in_path_and_act(shortest_path, env.Action.DROP_OFF)
 
     def _move_in_path_and_act(self, path: List[grid.Position], last_action: env.Action) -> env.Action:
+        self._previous_path = path
         if len(path) == 1:
             return last_action
-        curr_pos = path[0]
-        next_pos = path[1]
+        return self._move_action(path[0], path[1])
+
+    def _path_to_actions(self, path: List[grid.Position], last_action: env.Action) -> List[env.Action]:
+        """Converts a path into the moves to follow it, followed by last_action."""
+        moves = [self._move_action(curr_pos, next_pos) for curr_pos, next_pos in zip(path, path[1:])]
+        return moves + [last_action]
+
+    def _move_action(self, curr_pos: grid.Position, next_pos: grid.Position) -> env.Action:
         if next_pos == curr_pos.up:
             return env.Action.UP
         elif next_pos == curr_pos.down:
@@ -91,7 +251,13 @@ class PathBased(Base):
         # Visited stores already explored positions to avoid
         # loops.
         visited = set()
+        check_deadline = self._deadline is not None
+        n_explored = 0
         while len(queue) > 0:
+            # The clock is only read every few positions.
+            if check_deadline and n_explored % 8 == 0:
+                self._check_deadline()
+            n_explored += 1
             curr, curr_path = queue.pop(0)
             if curr in target.adj:
                 return list(curr_path)
@@ -103,9 +269,12 @@ class PathBased(Base):
         raise ValueError("No path found")
 
 
+@register
 class PathPlanner(PathBased):
     """Agent that plans its path using a BFS."""
 
+    deterministic = True
+
     def __init__(self, agent_id: int = 0) -> None:
         super().__init__()
         self._agent_id = agent_id
@@ -121,6 +290,120 @@ class PathPlanner(PathBased):
         return self._dropoff_current_passenger(map, agent_taxi)
     
 
+class RouteBased(Base):
+    """Base class for agents that commit to a route of actions.
+
+    The route is only changed when the agent decides to replan, so
+    act returns the actions of plan one by one. This allows the
+    environment to be fast-forwarded over the moves of the routes.
+    """
+
+    @abc.abstractmethod
+    def plan(self) -> List[env.Action]:
+        """Returns the remaining actions of the route for the last observation.
+
+        The last action of a non-empty route is the action that ends it,
+        such as PICK_UP or DROP_OFF, and all the previous are moves. An
+        empty route means the agent stays until it replans.
+        """
+        pass
+
+    @abc.abstractmethod
+    def advance(self, n_steps: int) -> None:
+        """Marks the first n_steps actions of the route as performed."""
+        pass
+
+
+@register
+class RouteFollower(RouteBased, PathPlanner):
+    """Path planner that commits to its route.
+
+    It chooses passengers like the PathPlanner but only replans when
+    the route is finished or a passenger is picked up or dropped off,
+    instead of computing a new path at every step.
+
+    When cells of the map change, the route is only replanned if a
+    closed cell is on its remaining path or if an opened cell makes the
+    target of the route closer, which is checked with the distance
+    fields of routing, updated incrementally.
+    """
+
+    # The action depends on the route, which is not part of the observation.
+    deterministic = False
+
+    def __init__(self, agent_id: int = 0) -> None:
+        super().__init__(agent_id=agent_id)
+        self._route: List[env.Action] = []
+        # Remaining positions of the route, one per action, and the
+        # location the route ends next to.
+        self._path: List[grid.Position] = []
+        self._target: Optional[grid.Position] = None
+        self._signature = None
+        self._map_version = 0
+
+    def plan(self) -> List[env.Action]:
+        signature = self._passengers_signature()
+        map = self._last_observation.map
+        if not self._route or signature != self._signature or self._route_affected(map):
+            self._route, self._path, self._target = self._compute_route()
+            self._signature = signature
+        self._map_version = map.version
+        return self._route
+
+    def advance(self, n_steps: int) -> None:
+        del self._route[:n_steps]
+        del self._path[:n_steps]
+
+    def act(self) -> env.Action:
+        route = self.plan()
+        if not route:
+            return env.Action.STAY
+        self._path.pop(0)
+        return route.pop(0)
+
+    def _fallback_action(self) -> env.Action:
+        """Keeps moving along the current route, which is replanned next step."""
+        if self._route and self._route[0] not in (env.Action.PICK_UP, env.Action.DROP_OFF):
+            self._path.pop(0)
+            return self._route.pop(0)
+        return env.Action.STAY
+
+    def _passengers_signature(self) -> tuple:
+        """Summarizes the passengers state that changes the route."""
+        return tuple((p.id, p.in_trip, p.pick_up) for p in self._last_observation.passengers)
+
+    def _route_affected(self, map: grid.Map) -> bool:
+        """Whether the map changes since the route was planned change it."""
+        if map.version == self._map_version or not self._route:
+            return False
+        changes = map.changes_since(self._map_version)
+        path = set(self._path)
+        if any(cell == grid.Cell.SIDEWALK and p in path for p, cell in changes):
+            return True
+        if any(cell == grid.Cell.ROAD for _, cell in changes):
+            distance = routing.cache(map).distance(self._path[0], self._target)
+            return distance is not None and distance + 1 < len(self._path)
+        return False
+
+    def _compute_route(self) -> Tuple[List[env.Action], List[grid.Position], Optional[grid.Position]]:
+        map = self._last_observation.map
+        agent_taxi = self._last_observation.taxis[self._agent_id]
+        passengers = self._last_observation.passengers
+
+        if agent_taxi.has_passenger is not None:
+            passenger = agent_taxi.has_passenger
+            path = self._bfs_with_positions(map, agent_taxi.loc, passenger.drop_off)
+            return self._path_to_actions(path, env.Action.DROP_OFF), path, passenger.drop_off
+
+        possible_passengers = [p for p in passengers if p.in_trip == entity.TripState.WAITING]
+        if len(possible_passengers) == 0:
+            return [], [], None
+        target = possible_passengers[self._nearest(map, agent_taxi.loc, [p.pick_up for p in possible_passengers])].pick_up
+        path = self._bfs_with_positions(map, agent_taxi.loc, target)
+        return self._path_to_actions(path, env.Action.PICK_UP), path, target
+
+
+@register
 class QuadrantsSocialConventions(PathBased):
     """Agent that uses social conventions to attribute passengers.
     
@@ -132,6 +415,8 @@ class QuadrantsSocialConventions(PathBased):
     |-------------------|-------------------|
     """
 
+    deterministic = True
+
     def __init__(self, agent_id: int = 0) -> None:
         super().__init__()
         self._agent_id = agent_id
@@ -170,6 +455,7 @@ class QuadrantsSocialConventions(PathBased):
         return pos.x >= map.width // 2 and pos.y >= map.height // 2
 
 
+@register
 class IDsSocialConventions(PathBased):
     """Agent that uses social conventions to attribute passengers by using their ID.
     
@@ -177,6 +463,8 @@ class IDsSocialConventions(PathBased):
     
     """
 
+    deterministic = True
+
     def __init__(self, agent_id: int = 0) -> None:
         super().__init__()
         self._agent_id = agent_id
@@ -197,9 +485,12 @@ class IDsSocialConventions(PathBased):
         return self._dropoff_current_passenger(map, agent_taxi)
 
 
+@register
 class Roles(PathBased):
     """Agent that attributes passengers based on distance to pick up location."""
 
+    deterministic = True
+
     def __init__(self, agent_id: int = 0) -> None:
         super().__init__()
         self._agent_id = agent_id
@@ -209,6 +500,23 @@ class Roles(PathBased):
         taxis = self._last_observation.taxis
         passengers = self._last_observation.passengers
 
+        roles = self._assign_roles(map, taxis, passengers)
+
+        agent_taxi = taxis[self._agent_id]
+        for t, p in roles:
+            if t == agent_taxi:
+                return self._role_action(map, agent_taxi, p)
+        return env.Action.STAY    
+
+    def _assign_roles(
+        self, map: grid.Map, taxis: List[entity.Taxi], passengers: List[entity.Passenger],
+    ) -> List[Tuple[Optional[entity.Taxi], entity.Passenger]]:
+        """Assigns each passenger to a taxi.
+
+        Passengers in trip are assigned to their taxis and each waiting
+        passenger is assigned to the nearest free taxi not yet assigned.
+        The taxi is None if there are no more free taxis.
+        """
         roles = []
 
         # First assign passengers already in trip to their taxis.
@@ -218,31 +526,221 @@ class Roles(PathBased):
             
         possible_passengers = [p for p in passengers if p.in_trip == entity.TripState.WAITING]
         possible_taxis = [t for t in taxis if t.has_passenger is None]
-        assigned_taxis = []
-        for p in possible_passengers:
-            shortest_paths = [
-                self._bfs_with_positions(map, t.loc, p.pick_up)
-                for t in possible_taxis
-            ]
+        if not possible_passengers:
+            return roles
+
+        # Distances from every free taxi to every waiting passenger.
+        distances = self._distances(
+            map, [t.loc for t in possible_taxis], [p.pick_up for p in possible_passengers],
+        ).astype(float)
+        for p, row in zip(possible_passengers, distances):
+            # The first nearest taxi not yet assigned.
             taxi = None
-            min_dist = np.inf
-            for t, path in zip(possible_taxis, shortest_paths):
-                if len(path) < min_dist and t not in assigned_taxis:
-                    min_dist = len(path)
-                    taxi = t
-            assigned_taxis.append(taxi)
+            if np.isfinite(row).any():
+                i = int(np.argmin(row))
+                taxi = possible_taxis[i]
+                distances[:, i] = np.inf
             roles.append((taxi, p))
+        return roles
 
-        agent_taxi = taxis[self._agent_id]
-        for t, p in roles:
-            if t == agent_taxi:
-                if agent_taxi.has_passenger:
-                    return self._dropoff_current_passenger(map, agent_taxi)
-                shortest_path = self._bfs_with_positions(map, agent_taxi.loc, p.pick_up)
-                return self._move_in_path_and_act(shortest_path, env.Action.PICK_UP)
-        return env.Action.STAY    
+    def _role_action(self, map: grid.Map, agent_taxi: entity.Taxi, passenger: entity.Passenger) -> env.Action:
+        """Action of a taxi to fulfill its assigned passenger."""
+        if agent_taxi.has_passenger:
+            return self._dropoff_current_passenger(map, agent_taxi)
+        shortest_path = self._bfs_with_positions(map, agent_taxi.loc, passenger.pick_up)
+        return self._move_in_path_and_act(shortest_path, env.Action.PICK_UP)
+
+
+class FleetPolicy(abc.ABC):
+    """Base class for policies that control all the taxis at once.
+
+    The policy receives a single observation per step and returns the
+    actions of all the taxis, so work shared by the taxis, such as
+    distances and assignments, is computed only once.
+
+    Attributes:
+        n_taxis: number of taxis controlled by the policy.
+        deterministic: whether the actions only depend on the observation.
+    """
 
+    n_taxis: int
+    deterministic = False
+
+    @abc.abstractmethod
+    def act(self, obs: env.Observation) -> List[env.Action]:
+        """Returns the actions of all the taxis for the observation."""
+        pass
+
+    def seed(self, seed: Optional[int]) -> None:
+        """Seeds the random decisions of the policy, such as with the seed
+        of each episode so that the episodes are reproducible from it.
+        None seeds them from fresh entropy. Policies without random
+        decisions ignore it."""
+        pass
+
+
+def agent_seeds(seed: Optional[int], n_agents: int) -> List[Optional[np.random.SeedSequence]]:
+    """Independent seeds of n_agents agents derived from seed."""
+    if seed is None:
+        return [None] * n_agents
+    return np.random.SeedSequence(seed).spawn(n_agents)
+
+
+class PerAgent(FleetPolicy):
+    """Fleet policy that delegates the decisions to independent agents."""
+
+    def __init__(self, agents: List[Base]) -> None:
+        self.agents = list(agents)
+        self.n_taxis = len(self.agents)
+        self.deterministic = all(a.deterministic for a in self.agents)
+
+    def act(self, obs: env.Observation) -> List[env.Action]:
+        for a in self.agents:
+            a.see(obs)
+        return [a.act() for a in self.agents]
+
+    def seed(self, seed: Optional[int]) -> None:
+        for a, agent_seed in zip(self.agents, agent_seeds(seed, len(self.agents))):
+            a.seed(agent_seed)
+
+
+def as_fleet(agents: Union[List[Base], FleetPolicy]) -> FleetPolicy:
+    """Wraps a list of agents into a fleet policy, if not one already."""
+    if isinstance(agents, FleetPolicy):
+        return agents
+    return PerAgent(agents)
+
+
+@register
+class FleetRandom(FleetPolicy):
+    """Fleet version of the Random agent.
+
+    The actions of all the taxis are drawn at once, in blocks of about
+    Random.BLOCK_SIZE actions, from a single generator, so the actions
+    are reproducible from the seed but differ from those of Random agents.
+    """
+
+    def __init__(self, n_taxis: int, seed: int = None) -> None:
+        self.n_taxis = n_taxis
+        self.seed(seed)
+
+    def seed(self, seed: Optional[int]) -> None:
+        # Derived like the seeds of the agents, so that the draws are
+        # independent from those of the environment with the same seed.
+        self._rng = np.random.default_rng(seed=agent_seeds(seed, 1)[0])
+        self._buffer: List[List[env.Action]] = []
+        self._next = 0
+
+    def act(self, obs: env.Observation) -> List[env.Action]:
+        if self._next == len(self._buffer):
+            n_steps = max(Random.BLOCK_SIZE // max(self.n_taxis, 1), 1)
+            indexes = self._rng.integers(len(Random.ACTIONS), size=(n_steps, self.n_taxis))
+            self._buffer = Random.ACTIONS[indexes].tolist()
+            self._next = 0
+        actions = self._buffer[self._next]
+        self._next += 1
+        return actions
+
+
+@register
+class FleetRoles(FleetPolicy):
+    """Fleet version of the Roles agent.
+
+    The passengers are assigned to the taxis once per step, instead of
+    once per taxi, and the actions are the same as with Roles agents.
+    """
+
+    deterministic = True
+
+    def __init__(self, n_taxis: int) -> None:
+        self.n_taxis = n_taxis
+        self._roles = Roles()
+
+    def act(self, obs: env.Observation) -> List[env.Action]:
+        roles = self._roles._assign_roles(obs.map, obs.taxis, obs.passengers)
+
+        # Each taxi follows its first role, as in Roles.
+        taxi_roles = {}
+        for t, p in roles:
+            if t is not None:
+                taxi_roles.setdefault(id(t), p)
+
+        actions = []
+        for t in obs.taxis:
+            if id(t) in taxi_roles:
+                actions.append(self._roles._role_action(obs.map, t, taxi_roles[id(t)]))
+            else:
+                actions.append(env.Action.STAY)
+        return actions
+
+
+class DecisionBudget(FleetPolicy):
+    """Fleet policy that bounds the time of the decisions of each taxi.
+
+    Independent agents based on PathBased get a deadline of budget
+    seconds for each decision, and return the best action found so far
+    or their fallback action when it passes. Other agents, and fleet
+    policies, cannot be interrupted, so their decisions are only
+    measured, and count as misses when they take longer than the budget
+    (the fleet policies have a budget of n_taxis times the budget).
+
+    Attributes:
+        misses: number of decisions that missed the deadline.
+        latencies: duration, in seconds, of each decision.
+    """
 
+    def __init__(self, agents: Union[List[Base], FleetPolicy], budget: float) -> None:
+        """
+        Args:
+            agents: agents or fleet policy that decides the actions.
+            budget: time in seconds for the decision of each taxi.
+        """
+        self._policy = as_fleet(agents)
+        self._agents = self._policy.agents if isinstance(self._policy, PerAgent) else None
+        self._budget = budget
+        self.n_taxis = self._policy.n_taxis
+        self.misses = 0
+        self.latencies = array.array("d")
+
+    @property
+    def n_decisions(self) -> int:
+        return len(self.latencies)
+
+    def seed(self, seed: Optional[int]) -> None:
+        self._policy.seed(seed)
+
+    def act(self, obs: env.Observation) -> List[env.Action]:
+        if self._agents is None:
+            start = time.perf_counter()
+            actions = self._policy.act(obs)
+            self._record(time.perf_counter() - start, self._budget * self.n_taxis, False)
+            return actions
+
+        actions = []
+        for a in self._agents:
+            start = time.perf_counter()
+            a.see(obs)
+            if isinstance(a, PathBased):
+                action, missed = a.decide(start + self._budget)
+            else:
+                action, missed = a.act(), False
+            self._record(time.perf_counter() - start, self._budget, missed)
+            actions.append(action)
+        return actions
+
+    def percentiles(self, q: Sequence[float] = (50, 90, 99)) -> List[float]:
+        """Percentiles of the decision latencies, in seconds."""
+        if not self.latencies:
+            return [np.nan for _ in q]
+        return np.percentile(np.frombuffer(self.latencies, dtype=float), q).tolist()
+
+    def _record(self, latency: float, budget: float, missed: bool):
+        self.latencies.append(latency)
+        if missed or latency > budget:
+            self.misses += 1
+
+
+@register
 class Debug(Base):
     """Debug agent that prompts the user for the next action."""
 
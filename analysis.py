@@ -0,0 +1,307 @@
+import argparse
+import glob
+import numpy as np
+import os
+import re
+import stats
+
+from typing import Dict, List, Optional, Sequence
+
+METRICS = ("taxi_distance", "pick_up_time", "drop_off_time", "n_delivered", "n_steps")
+"""Columns of the metrics files written by run.py."""
+
+OPTIONAL = {"stalled": 0.0}
+"""Columns added to the metrics files later, with their value in the
+files written before."""
+
+DERIVED = ("transportation_time",)
+"""Columns computed from the metrics columns."""
+
+LABELS = {
+    "Random": "Random",
+    "PathPlanner": "Path Planner",
+    "QuadrantsSocialConventions": "Quadrants",
+    "IDsSocialConventions": "Identifiers",
+    "Roles": "Roles",
+}
+"""Names of the agent types in the plots."""
+
+_FILE_PATTERN = re.compile(r"metrics-(?P<agent>\w+?)-agents-(?P<agents>\d+)-passengers-(?P<passengers>\d+)\.csv$")
+
+Dataset = Dict[str, np.ndarray]
+"""Columnar dataset mapping column names to arrays of the same length."""
+
+
+def ingest(paths: Sequence[str]) -> Dataset:
+    """Reads metrics files into a single columnar dataset.
+
+    Besides the metrics, the dataset has the columns agent, n_agents and
+    n_passengers, parsed from the file names, the run index in the file
+    as episode, and the derived columns.
+    """
+    columns: Dict[str, List[np.ndarray]] = {
+        name: [] for name in ("agent", "n_agents", "n_passengers", "episode", *METRICS, *OPTIONAL)
+    }
+    for path in sorted(paths):
+        match = _FILE_PATTERN.search(os.path.basename(path))
+        if match is None:
+            raise ValueError(f"Not a metrics file: {path}")
+        with open(path, "r") as fp:
+            header = fp.readline().strip().split(",")
+            values = np.loadtxt(fp, delimiter=",", ndmin=2)
+        n = len(values)
+        columns["agent"].append(np.full(n, match["agent"], dtype=object))
+        columns["n_agents"].append(np.full(n, int(match["agents"])))
+        columns["n_passengers"].append(np.full(n, int(match["passengers"])))
+        columns["episode"].append(np.arange(n))
+        for name in METRICS:
+            columns[name].append(values[:, header.index(name)] if n else np.empty(0))
+        for name, default in OPTIONAL.items():
+            if name in header and n:
+                columns[name].append(values[:, header.index(name)])
+            else:
+                columns[name].append(np.full(n, default))
+
+    data = {name: np.concatenate(parts) if parts else np.empty(0) for name, parts in columns.items()}
+    data["agent"] = data["agent"].astype(str)
+    data["transportation_time"] = data["pick_up_time"] + data["drop_off_time"]
+    return data
+
+
+def save(data: Dataset, path: str):
+    np.savez_compressed(path, **data)
+
+
+def load(path: str) -> Dataset:
+    with np.load(path) as f:
+        data = {name: f[name] for name in f.files}
+    n = len(data["episode"])
+    for name, default in OPTIONAL.items():
+        data.setdefault(name, np.full(n, default))
+    return data
+
+
+def load_or_ingest(path: str, pattern: str) -> Dataset:
+    """Loads the dataset, ingesting the metrics files again if any is newer."""
+    files = glob.glob(pattern)
+    if os.path.exists(path):
+        mtime = os.path.getmtime(path)
+        if all(os.path.getmtime(f) <= mtime for f in files):
+            return load(path)
+    data = ingest(files)
+    save(data, path)
+    return data
+
+
+def select(data: Dataset, **conditions) -> Dataset:
+    """Selects the rows where each column is equal to the given value."""
+    mask = np.ones(len(data["agent"]), dtype=bool)
+    for name, value in conditions.items():
+        mask &= data[name] == value
+    return {name: column[mask] for name, column in data.items()}
+
+
+def grouped_stats(data: Dataset, by: Sequence[str], metric: str) -> Dataset:
+    """Computes the mean, standard deviation and 95% confidence interval
+    of a metric for each group of rows with equal values in the by columns.
+
+    Returns: A dataset with one row per group, with the by columns and
+        the columns n, mean, std and ci (half-width of the interval).
+    """
+    keys = [np.unique(data[name], return_inverse=True) for name in by]
+    codes = np.stack([inverse.reshape(-1) for _, inverse in keys], axis=1)
+    groups, group_idx = np.unique(codes, axis=0, return_inverse=True)
+    group_idx = group_idx.reshape(-1)
+
+    values = data[metric].astype(float)
+    n = np.bincount(group_idx, minlength=len(groups))
+    total = np.bincount(group_idx, weights=values, minlength=len(groups))
+    mean = total / n
+    squares = np.bincount(group_idx, weights=(values - mean[group_idx]) ** 2, minlength=len(groups))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        std = np.sqrt(squares / (n - 1))
+    std[n < 2] = 0.0
+
+    result = {name: uniques[groups[:, i]] for i, (name, (uniques, _)) in enumerate(zip(by, keys))}
+    result.update(n=n, mean=mean, std=std, ci=stats.z_value(0.95) * std / np.sqrt(n))
+    return result
+
+
+def format_stats(grouped: Dataset, by: Sequence[str]) -> str:
+    rows = [[*by, "n", "mean", "std", "ci"]]
+    for i in range(len(grouped["n"])):
+        rows.append([
+            *(str(grouped[name][i]) for name in by),
+            str(grouped["n"][i]),
+            f"{grouped['mean'][i]:.3f}",
+            f"{grouped['std'][i]:.3f}",
+            f"{grouped['ci'][i]:.3f}",
+        ])
+    widths = [max(len(r[c]) for r in rows) for c in range(len(rows[0]))]
+    return "\n".join("  ".join(v.rjust(w) for v, w in zip(r, widths)) for r in rows)
+
+
+def compare(data: Dataset, a: str, b: str, metric: str, confidence: float = 0.95) -> Dataset:
+    """Compares a metric between two agent types for each number of
+    agents and passengers.
+
+    The runs are paired by episode, which is only meaningful when both
+    agent types were run with the same scenario_seed, so that episode i
+    started from the same scenario for both.
+
+    Returns: A dataset with one row per (n_agents, n_passengers) with
+        both agent types, with the columns n, diff (mean of a - b) and
+        the interval half-widths paired_ci and unpaired_ci.
+    """
+    a_rows = select(data, agent=a)
+    b_rows = select(data, agent=b)
+    configs = sorted(
+        set(zip(a_rows["n_agents"].tolist(), a_rows["n_passengers"].tolist()))
+        & set(zip(b_rows["n_agents"].tolist(), b_rows["n_passengers"].tolist()))
+    )
+    result: Dict[str, List] = {name: [] for name in ("n_agents", "n_passengers", "n", "diff", "paired_ci", "unpaired_ci")}
+    for n_agents, n_passengers in configs:
+        a_config = select(a_rows, n_agents=n_agents, n_passengers=n_passengers)
+        b_config = select(b_rows, n_agents=n_agents, n_passengers=n_passengers)
+        episodes, a_idx, b_idx = np.intersect1d(a_config["episode"], b_config["episode"], return_indices=True)
+        a_values = a_config[metric][a_idx]
+        b_values = b_config[metric][b_idx]
+        diff, paired_ci = stats.paired_difference(a_values, b_values, confidence)
+        _, unpaired_ci = stats.unpaired_difference(a_values, b_values, confidence)
+        result["n_agents"].append(n_agents)
+        result["n_passengers"].append(n_passengers)
+        result["n"].append(len(episodes))
+        result["diff"].append(diff)
+        result["paired_ci"].append(paired_ci)
+        result["unpaired_ci"].append(unpaired_ci)
+    return {name: np.asarray(values) for name, values in result.items()}
+
+
+def format_comparison(compared: Dataset) -> str:
+    rows = [["n_agents", "n_passengers", "n", "diff", "paired_ci", "unpaired_ci"]]
+    for i in range(len(compared["n"])):
+        rows.append([
+            str(compared["n_agents"][i]),
+            str(compared["n_passengers"][i]),
+            str(compared["n"][i]),
+            f"{compared['diff'][i]:.3f}",
+            f"{compared['paired_ci'][i]:.3f}",
+            f"{compared['unpaired_ci'][i]:.3f}",
+        ])
+    widths = [max(len(r[c]) for r in rows) for c in range(len(rows[0]))]
+    return "\n".join("  ".join(v.rjust(w) for v, w in zip(r, widths)) for r in rows)
+
+
+PLOTS = {
+    "passengers": {
+        "x": "n_passengers",
+        "fixed": {"n_agents": 15},
+        "xlabel": "Number of Passengers",
+        "suffix": "var_pass",
+    },
+    "agents": {
+        "x": "n_agents",
+        "fixed": {"n_passengers": 25},
+        "xlabel": "Number of Agents",
+        "suffix": "var_agents",
+    },
+}
+"""Standard plots, with the varying column and the fixed columns."""
+
+PLOT_METRICS = {
+    "n_steps": "Simulation Steps",
+    "pick_up_time": "Average Pick-Up Time",
+    "taxi_distance": "Average Taxi Distance",
+    "transportation_time": "Average Transportation Time",
+}
+
+
+def plot(data: Dataset, kind: str, out_dir: str = ".", exclude: Sequence[str] = ("Random",)):
+    """Plots the mean and 95% confidence interval of the standard metrics
+    for each agent type and saves them as pdf files."""
+    # Only needed for plotting so that the remaining commands
+    # do not require matplotlib.
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    spec = PLOTS[kind]
+    data = select(data, **spec["fixed"])
+    keep = ~np.isin(data["agent"], list(exclude))
+    data = {name: column[keep] for name, column in data.items()}
+
+    for metric, ylabel in PLOT_METRICS.items():
+        grouped = grouped_stats(data, ("agent", spec["x"]), metric)
+        _, ax = plt.subplots(1, 1, figsize=(8, 7))
+        for agent in np.unique(grouped["agent"]):
+            rows = grouped["agent"] == agent
+            ax.errorbar(
+                grouped[spec["x"]][rows],
+                grouped["mean"][rows],
+                yerr=grouped["ci"][rows],
+                marker="o",
+                capsize=4,
+                label=LABELS.get(agent, agent),
+            )
+        ax.set_title(f"{ylabel} discriminated by\n{spec['xlabel']} and Agent Architecture")
+        ax.set_xlabel(spec["xlabel"])
+        ax.set_ylabel(ylabel)
+        ax.grid(True)
+        ax.legend(title="Agent Architecture")
+        plt.savefig(os.path.join(out_dir, f"{metric}_{spec['suffix']}.pdf"))
+        plt.close()
+
+
+def _parse_conditions(conditions: Optional[List[str]]) -> Dict[str, object]:
+    parsed = {}
+    for c in conditions or []:
+        name, value = c.split("=", 1)
+        parsed[name] = int(value) if value.isdigit() else value
+    return parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analysis of the metrics files written by run.py.")
+    parser.add_argument("--dataset", default="results.npz", help="consolidated dataset file")
+    parser.add_argument("--files", default="metrics-*.csv", help="glob pattern of the metrics files")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("ingest", help="ingest the metrics files into the dataset")
+
+    stats_parser = commands.add_parser("stats", help="print grouped statistics of a metric")
+    stats_parser.add_argument("metric", choices=METRICS + tuple(OPTIONAL) + DERIVED)
+    stats_parser.add_argument("--by", nargs="+", default=["agent", "n_agents", "n_passengers"])
+    stats_parser.add_argument("--where", nargs="*", help="filters as column=value")
+
+    compare_parser = commands.add_parser(
+        "compare", help="compare a metric between two agent types run with the same scenario_seed",
+    )
+    compare_parser.add_argument("a", help="agent type")
+    compare_parser.add_argument("b", help="agent type")
+    compare_parser.add_argument("metric", choices=METRICS + tuple(OPTIONAL) + DERIVED)
+    compare_parser.add_argument("--confidence", type=float, default=0.95)
+
+    plot_parser = commands.add_parser("plot", help="plot the standard figures")
+    plot_parser.add_argument("kind", choices=sorted(PLOTS))
+    plot_parser.add_argument("--out-dir", default=".")
+    plot_parser.add_argument("--exclude", nargs="*", default=["Random"])
+
+    args = parser.parse_args()
+    if args.command == "ingest":
+        data = ingest(glob.glob(args.files))
+        save(data, args.dataset)
+        print(f"Ingested {len(data['agent'])} runs into {args.dataset}")
+        return
+
+    data = load_or_ingest(args.dataset, args.files)
+    if args.command == "stats":
+        data = select(data, **_parse_conditions(args.where))
+        print(format_stats(grouped_stats(data, args.by, args.metric), args.by))
+    elif args.command == "compare":
+        print(format_comparison(compare(data, args.a, args.b, args.metric, args.confidence)))
+    elif args.command == "plot":
+        plot(data, args.kind, out_dir=args.out_dir, exclude=args.exclude)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import agent
+import argparse
+import default
+import entity
+import env
+import grid
+import json
+import numpy as np
+import os
+import platform
+import routing
+import sys
+import timeit
+
+from typing import Callable, Dict, List, Tuple
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+"""Baseline results stored in the repository."""
+
+SIZES: List[Tuple[int, int]] = [(1, 5), (2, 20), (4, 80)]
+"""Benchmark sizes as (map scale, number of entities)."""
+
+N_QUERIES = 200
+"""Number of inputs of the benchmarks that time a batch of queries."""
+
+Benchmark = Callable[[int, int], Callable[[], object]]
+
+
+def scaled_map(scale: int) -> grid.Map:
+    """Map with the default map interior repeated scale x scale times.
+
+    The interior of the default map has roads along its edges, so the
+    copies are connected to each other and the map has a single road
+    network, surrounded by sidewalks.
+    """
+    interior = default.MAP[1:-1, 1:-1]
+    tiled = np.tile(interior, (scale, scale))
+    return grid.Map(np.pad(tiled, 1, constant_values=grid.Cell.SIDEWALK))
+
+
+def _environment(scale: int, n: int) -> env.Environment:
+    environment = env.Environment(
+        map=scaled_map(scale), init_taxis=n, init_passengers=n, log_level="error", seed=0,
+    )
+    environment.reset()
+    return environment
+
+
+def _positions(candidates: List[grid.Position], n: int) -> List[grid.Position]:
+    rng = np.random.default_rng(0)
+    return [candidates[i] for i in rng.integers(len(candidates), size=n)]
+
+
+def bench_is_road(scale: int, n: int) -> Callable[[], object]:
+    map = scaled_map(scale)
+    positions = _positions(map.all_positions, N_QUERIES)
+    return lambda: [map.is_road(p) for p in positions]
+
+
+def bench_adj(scale: int, n: int) -> Callable[[], object]:
+    map = scaled_map(scale)
+    positions = _positions(map.all_positions, N_QUERIES)
+    return lambda: [p.adj for p in positions]
+
+
+def bench_choose_adj_passenger(scale: int, n: int) -> Callable[[], object]:
+    environment = _environment(scale, n)
+    map = environment.map
+    positions = _positions(map.possible_taxi_positions, N_QUERIES)
+    passengers = environment.passengers
+    return lambda: [map.choose_adj_passenger(p, passengers, entity.TripState) for p in positions]
+
+
+def bench_bfs_with_positions(scale: int, n: int) -> Callable[[], object]:
+    map = scaled_map(scale)
+    planner = agent.PathPlanner(agent_id=0)
+    sources = _positions(map.possible_taxi_positions, n)
+    targets = _positions(map.possible_passenger_positions, n)
+    pairs = list(zip(sources, targets))
+    return lambda: [planner._bfs_with_positions(map, s, t) for s, t in pairs]
+
+
+def bench_wavefront(scale: int, n: int) -> Callable[[], object]:
+    map = scaled_map(scale)
+    targets = _positions(map.possible_passenger_positions, n)
+    return lambda: routing.wavefront(map.road_mask, targets)
+
+
+def bench_reset(scale: int, n: int) -> Callable[[], object]:
+    environment = _environment(scale, n)
+    return environment._reset
+
+
+def bench_delete_passengers(scale: int, n: int) -> Callable[[], object]:
+    environment = _environment(scale, n)
+    # Half of the passengers are delivered, so the call both finds the
+    # delivered passengers and removes the ones from the previous step.
+    for p in environment.passengers[::2]:
+        p.pick_up = p.drop_off
+    delivered = environment._active.copy()
+    delivered[1::2] = False
+
+    def delete():
+        environment._active[:] = True
+        environment._pending = delivered.copy()
+        environment.final_passengers = []
+        environment._delete_passengers()
+
+    return delete
+
+
+BENCHMARKS: Dict[str, Benchmark] = {
+    "Map.is_road": bench_is_road,
+    "Position.adj": bench_adj,
+    "Map.choose_adj_passenger": bench_choose_adj_passenger,
+    "PathBased._bfs_with_positions": bench_bfs_with_positions,
+    "routing.wavefront": bench_wavefront,
+    "Environment._reset": bench_reset,
+    "Environment._delete_passengers": bench_delete_passengers,
+}
+"""Benchmarks by name. Each builds the seeded inputs for a map scale
+and number of entities and returns the function to time."""
+
+
+def case_name(name: str, scale: int, n: int) -> str:
+    return f"{name}[scale={scale},n={n}]"
+
+
+def time_call(fn: Callable[[], object], repeat: int = 5) -> float:
+    """Best time in seconds of a call, over repeat runs of at least 0.2s."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run(names: List[str], repeat: int = 5) -> Dict[str, float]:
+    results = {}
+    for name in names:
+        for scale, n in SIZES:
+            results[case_name(name, scale, n)] = time_call(BENCHMARKS[name](scale, n), repeat)
+    return results
+
+
+def load_baseline(path: str) -> Dict[str, float]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as fp:
+        return json.load(fp)["results"]
+
+
+def save_baseline(path: str, results: Dict[str, float]):
+    # The machine is only recorded for reference, as timings are
+    # only comparable on the machine that produced the baseline.
+    data = {
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "numpy": np.__version__},
+        "results": results,
+    }
+    with open(path, "w") as fp:
+        json.dump(data, fp, indent=2, sort_keys=True)
+        fp.write("\n")
+
+
+def report(results: Dict[str, float], baseline: Dict[str, float], threshold: float) -> Tuple[str, List[str]]:
+    """Compares the results against the baseline.
+
+    A case is a regression when it takes more than (1 + threshold)
+    times the baseline time.
+
+    Returns: The report text and the names of the regressed cases.
+    """
+    rows = [["case", "baseline (us)", "current (us)", "speedup", ""]]
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            rows.append([name, "-", f"{current * 1e6:.1f}", "-", "new"])
+            continue
+        speedup = base / current
+        status = ""
+        if current > base * (1 + threshold):
+            status = "REGRESSION"
+            regressions.append(name)
+        elif speedup > 1 + threshold:
+            status = "faster"
+        rows.append([name, f"{base * 1e6:.1f}", f"{current * 1e6:.1f}", f"{speedup:.2f}x", status])
+    widths = [max(len(r[c]) for r in rows) for c in range(len(rows[0]))]
+    lines = ["  ".join(v.ljust(w) if c == 0 else v.rjust(w) for c, (v, w) in enumerate(zip(r, widths))) for r in rows]
+    return "\n".join(lines), regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the simulation hot paths.")
+    parser.add_argument("--only", action="append", choices=list(BENCHMARKS), help="benchmark to run (default: all)")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline results file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown reported as regression")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args()
+
+    names = args.only or list(BENCHMARKS)
+    results = run(names, repeat=args.repeat)
+    text, regressions = report(results, load_baseline(args.baseline), args.threshold)
+    print(text)
+
+    if args.save:
+        # Keep the baseline of the benchmarks that were not run.
+        save_baseline(args.baseline, {**load_baseline(args.baseline), **results})
+        print(f"Saved baseline to {args.baseline}")
+    elif regressions:
+        print(f"{len(regressions)} regressions above {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
+import collections
+import functools
 import numpy as np
 
-from typing import List, Optional, Tuple
+from typing import Deque, Dict, List, Sequence, Tuple
 
 Colour = Tuple[int, int, int]
 
@@ -8,34 +10,94 @@ ROADS: List[Colour] = [(58, 68, 102), (38, 43, 68)]
 SIDEWALKS: List[Colour] = [(228, 166, 114), (216, 118, 68), (190, 74, 47)]
 TAXI: List[Colour] = [(254, 231, 97)]
 
-class Picker:
-    def __init__(self, seed: Optional[int] = None) -> None:
-        self._rng = np.random.default_rng(seed)
-        self._choices = np.arange(256)
-
-    def random_not_close(self, *not_close: Colour):
-        colour = self._unchecked_random()
-        not_close = list(not_close)
-        checked = False
-        while not checked:
-            found_close = False
-            for c in not_close:
-                if are_similar(colour, c):
-                    found_close = True
-                    break
-            if found_close:
-                colour = self._unchecked_random()
-                found_close = False
-            else:
-                checked = True
-        return colour
-
-    def _unchecked_random(self):
-        return tuple(self._rng.choice(self._choices, size=3))
-
-
-def are_similar(a: Colour, b: Colour, tol: int = 50) -> bool:
-    """Verifies if two colours are similar."""
-    a = np.array(a)
-    b = np.array(b)
-    return np.all(np.abs(a - b) <= tol)
+class Palette:
+    """Fixed set of well separated colours that are assigned and recycled.
+
+    The colours are chosen once with greedy farthest-point sampling in
+    the CIELAB space, which approximates perceptual distance, starting
+    away from the reserved colours (roads, sidewalks and taxis by default).
+    Colours are handed out in the order they were chosen, so the first
+    ones are the most distinct, and released colours go to the back of
+    the queue.
+
+    When all colours are in use, acquire falls back to reusing the
+    palette colours cyclically, so two passengers may share a colour
+    but acquire never blocks.
+    """
+
+    def __init__(self, size: int = 64, reserved: Sequence[Colour] = (*ROADS, *SIDEWALKS, *TAXI)):
+        self._colours = _farthest_colours(size, tuple(reserved))
+        self._index: Dict[Colour, int] = {c: i for i, c in enumerate(self._colours)}
+        self._users = [0] * len(self._colours)
+        self._free: Deque[int] = collections.deque(range(len(self._colours)))
+        self._overflow = 0
+
+    @property
+    def colours(self) -> List[Colour]:
+        return list(self._colours)
+
+    def acquire(self) -> Colour:
+        """Returns an unused colour, or a shared one if all are in use."""
+        if self._free:
+            idx = self._free.popleft()
+        else:
+            idx = self._overflow % len(self._colours)
+            self._overflow += 1
+        self._users[idx] += 1
+        return self._colours[idx]
+
+    def release(self, colour: Colour) -> None:
+        """Returns a colour obtained with acquire to the palette."""
+        idx = self._index[colour]
+        if self._users[idx] == 0:
+            raise ValueError(f"Colour not in use: {colour}")
+        self._users[idx] -= 1
+        if self._users[idx] == 0:
+            self._free.append(idx)
+
+
+@functools.lru_cache(maxsize=None)
+def _farthest_colours(size: int, reserved: Tuple[Colour, ...], levels: int = 16) -> Tuple[Colour, ...]:
+    """Greedily chooses size colours as far as possible from each other.
+
+    The candidates are a regular grid in RGB space with the given levels
+    per channel. At each iteration, the candidate with the largest distance
+    to the already chosen and reserved colours is selected.
+    """
+    if size <= 0:
+        raise ValueError(f"Palette size must be positive: {size}")
+    channel = np.linspace(0, 255, levels).round().astype(int)
+    candidates = np.stack(np.meshgrid(channel, channel, channel, indexing="ij"), axis=-1).reshape(-1, 3)
+    if size > len(candidates):
+        raise ValueError(f"Palette size must be at most {len(candidates)}: {size}")
+    lab = _rgb_to_lab(candidates)
+
+    min_dist = np.full(len(candidates), np.inf)
+    for c in reserved:
+        min_dist = np.minimum(min_dist, np.linalg.norm(lab - _rgb_to_lab(np.array([c])), axis=1))
+
+    chosen = []
+    for _ in range(size):
+        idx = int(np.argmax(min_dist))
+        chosen.append(tuple(int(v) for v in candidates[idx]))
+        min_dist = np.minimum(min_dist, np.linalg.norm(lab - lab[idx], axis=1))
+    return tuple(chosen)
+
+
+def _rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """Converts (n, 3) sRGB colours in [0, 255] to CIELAB (D65 white)."""
+    c = rgb / 255
+    c = np.where(c > 0.04045, ((c + 0.055) / 1.055) ** 2.4, c / 12.92)
+    xyz = c @ np.array([
+        [0.4124, 0.2126, 0.0193],
+        [0.3576, 0.7152, 0.1192],
+        [0.1805, 0.0722, 0.9505],
+    ])
+    xyz = xyz / np.array([0.9505, 1.0, 1.089])
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([
+        116 * f[:, 1] - 16,
+        500 * (f[:, 0] - f[:, 1]),
+        200 * (f[:, 1] - f[:, 2]),
+    ], axis=1)
+
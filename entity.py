@@ -1,6 +1,8 @@
-import dataclasses
 import enum
 import grid
+import numpy as np
+
+from typing import List, Optional, Tuple
 
 
 
@@ -14,20 +16,6 @@ class TripState(enum.Enum):
         return f"TripState({self.name})"
 
 
-@dataclasses.dataclass
-class Passenger:
-    pick_up: grid.Position
-    drop_off: grid.Position
-    in_trip : TripState = TripState.WAITING
-    
-    # Id for agent identification
-    id: int = 0        
-    
-    # Passenger metrics
-    pick_up_time: int = 0
-    travel_time: int = 0
-
-
 class Direction(enum.Enum):
     UP = 0
     DOWN = 1
@@ -37,18 +25,363 @@ class Direction(enum.Enum):
     def __repr__(self) -> str:
         return f"Direction({self.name})"
 
-@dataclasses.dataclass
+
+_TRIP_STATES = tuple(sorted(TripState, key=lambda s: s.value))
+_DIRECTIONS = tuple(sorted(Direction, key=lambda d: d.value))
+
+
+class Store:
+    """Struct-of-arrays storage for entities.
+
+    Each field is a contiguous int64 array, stored as a row of a single
+    (fields, capacity) array, so whole-store updates are vectorized
+    operations and the full state is copied with a single array copy.
+    Only the first size entries are in use.
+
+    The entities are accessed through view objects that read and write
+    the arrays, and there is exactly one view for each entry, so views
+    can be compared by identity.
+    """
+
+    FIELDS: Tuple[str, ...] = ()
+
+    # Fields with positions, as pairs of x and y fields. The Position
+    # objects are cached so that repeated reads do not allocate.
+    POSITIONS: Tuple[Tuple[str, str], ...] = ()
+
+    def __init__(self, capacity: int):
+        self.size = 0
+        self._data = np.zeros((len(self.FIELDS), max(capacity, 1)), dtype=np.int64)
+        self._bind()
+        self._views: list = []
+        self._positions: List[List[Optional[grid.Position]]] = [[] for _ in self.POSITIONS]
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def views(self) -> list:
+        """Views for the entries in use, ordered by index."""
+        return list(self._views)
+
+    def view(self, index: int):
+        return self._views[index]
+
+    def state(self) -> np.ndarray:
+        """Copies the fields of the entries in use into a (fields, size) array."""
+        return self._data[:, :self.size].copy()
+
+    def set_state(self, state: np.ndarray):
+        """Overwrites the fields of the entries in use with a state array."""
+        if state.shape != (len(self.FIELDS), self.size):
+            raise ValueError(f"Expected state with shape {(len(self.FIELDS), self.size)} but got {state.shape}")
+        self._data[:, :self.size] = state
+        self.invalidate_positions()
+
+    def invalidate_positions(self, indexes=None):
+        """Drops the cached positions after the position arrays are written directly."""
+        for cache in self._positions:
+            if indexes is None:
+                cache[:] = [None] * len(cache)
+            else:
+                for i in np.atleast_1d(indexes).tolist():
+                    cache[i] = None
+
+    def _bind(self):
+        for i, name in enumerate(self.FIELDS):
+            setattr(self, name, self._data[i])
+
+    def _attach(self, view):
+        """Allocates a new entry for the view."""
+        if self.size == self._data.shape[1]:
+            data = np.zeros((len(self.FIELDS), 2 * self.size), dtype=np.int64)
+            data[:, :self.size] = self._data
+            self._data = data
+            self._bind()
+        view._store = self
+        view._index = self.size
+        self._views.append(view)
+        for cache in self._positions:
+            cache.append(None)
+        self.size += 1
+
+    def _copy_into(self, other: "Store"):
+        other.size = self.size
+        other._data = self._data.copy()
+        other._bind()
+        other._positions = [list(cache) for cache in self._positions]
+
+    def _get_position(self, pos_idx: int, index: int) -> grid.Position:
+        p = self._positions[pos_idx][index]
+        if p is None:
+            x_field, y_field = self.POSITIONS[pos_idx]
+            p = grid.Position(x=int(getattr(self, x_field)[index]), y=int(getattr(self, y_field)[index]))
+            self._positions[pos_idx][index] = p
+        return p
+
+    def _set_position(self, pos_idx: int, index: int, p: grid.Position):
+        x_field, y_field = self.POSITIONS[pos_idx]
+        getattr(self, x_field)[index] = p.x
+        getattr(self, y_field)[index] = p.y
+        self._positions[pos_idx][index] = p
+
+
+class PassengerStore(Store):
+    """Struct-of-arrays storage for passengers."""
+
+    FIELDS = (
+        "pick_up_x",
+        "pick_up_y",
+        "drop_off_x",
+        "drop_off_y",
+        "in_trip",
+        "id",
+        "pick_up_time",
+        "travel_time",
+    )
+    POSITIONS = (("pick_up_x", "pick_up_y"), ("drop_off_x", "drop_off_y"))
+
+    def add(
+        self,
+        pick_up: grid.Position,
+        drop_off: grid.Position,
+        in_trip: TripState = TripState.WAITING,
+        id: int = 0,
+        pick_up_time: int = 0,
+        travel_time: int = 0,
+    ) -> "Passenger":
+        passenger = object.__new__(Passenger)
+        self._attach(passenger)
+        passenger._set(pick_up, drop_off, in_trip, id, pick_up_time, travel_time)
+        return passenger
+
+    def copy(self) -> "PassengerStore":
+        """Copies the store, with new views for the copied entries."""
+        other = object.__new__(PassengerStore)
+        self._copy_into(other)
+        other._views = []
+        for i in range(self.size):
+            view = object.__new__(Passenger)
+            view._store = other
+            view._index = i
+            other._views.append(view)
+        return other
+
+
+class Passenger:
+    """View of a passenger in a PassengerStore.
+
+    Passengers created directly get their own single entry store.
+    """
+
+    __slots__ = ("_store", "_index")
+
+    def __init__(
+        self,
+        pick_up: grid.Position,
+        drop_off: grid.Position,
+        in_trip: TripState = TripState.WAITING,
+        id: int = 0,
+        pick_up_time: int = 0,
+        travel_time: int = 0,
+    ):
+        PassengerStore(capacity=1)._attach(self)
+        self._set(pick_up, drop_off, in_trip, id, pick_up_time, travel_time)
+
+    def _set(self, pick_up, drop_off, in_trip, id, pick_up_time, travel_time):
+        self.pick_up = pick_up
+        self.drop_off = drop_off
+        self.in_trip = in_trip
+        self.id = id
+        self.pick_up_time = pick_up_time
+        self.travel_time = travel_time
+
+    @property
+    def pick_up(self) -> grid.Position:
+        return self._store._get_position(0, self._index)
+
+    @pick_up.setter
+    def pick_up(self, p: grid.Position):
+        self._store._set_position(0, self._index, p)
+
+    @property
+    def drop_off(self) -> grid.Position:
+        return self._store._get_position(1, self._index)
+
+    @drop_off.setter
+    def drop_off(self, p: grid.Position):
+        self._store._set_position(1, self._index, p)
+
+    @property
+    def in_trip(self) -> TripState:
+        return _TRIP_STATES[self._store.in_trip[self._index]]
+
+    @in_trip.setter
+    def in_trip(self, s: TripState):
+        self._store.in_trip[self._index] = s.value
+
+    # Id for agent identification
+    @property
+    def id(self) -> int:
+        return int(self._store.id[self._index])
+
+    @id.setter
+    def id(self, v: int):
+        self._store.id[self._index] = v
+
+    # Passenger metrics
+    @property
+    def pick_up_time(self) -> int:
+        return int(self._store.pick_up_time[self._index])
+
+    @pick_up_time.setter
+    def pick_up_time(self, v: int):
+        self._store.pick_up_time[self._index] = v
+
+    @property
+    def travel_time(self) -> int:
+        return int(self._store.travel_time[self._index])
+
+    @travel_time.setter
+    def travel_time(self, v: int):
+        self._store.travel_time[self._index] = v
+
+    def __repr__(self) -> str:
+        return (
+            f"Passenger(pick_up={self.pick_up!r}, drop_off={self.drop_off!r}, in_trip={self.in_trip!r}, "
+            f"id={self.id!r}, pick_up_time={self.pick_up_time!r}, travel_time={self.travel_time!r})"
+        )
+
+
+class TaxiStore(Store):
+    """Struct-of-arrays storage for taxis.
+
+    The passenger field is the index of the taxi passenger in the
+    associated passengers store, or -1 if the taxi has no passenger.
+    """
+
+    FIELDS = ("x", "y", "direction", "passenger", "id", "total_distance")
+    POSITIONS = (("x", "y"),)
+
+    def __init__(self, capacity: int, passengers: Optional[PassengerStore] = None):
+        super().__init__(capacity)
+        self.passengers = passengers
+
+    def add(
+        self,
+        loc: grid.Position,
+        direction: Direction,
+        has_passenger: Optional[Passenger] = None,
+        id: int = 0,
+        total_distance: int = 0,
+    ) -> "Taxi":
+        taxi = object.__new__(Taxi)
+        self._attach(taxi)
+        taxi._set(loc, direction, has_passenger, id, total_distance)
+        return taxi
+
+    def copy(self, passengers: Optional[PassengerStore] = None) -> "TaxiStore":
+        """Copies the store, with new views for the copied entries.
+
+        Args:
+            passengers: copy of the passengers store to associate with
+                the copy. Defaults to the store of this taxis.
+        """
+        other = object.__new__(TaxiStore)
+        self._copy_into(other)
+        other.passengers = passengers if passengers is not None else self.passengers
+        other._views = []
+        for i in range(self.size):
+            view = object.__new__(Taxi)
+            view._store = other
+            view._index = i
+            other._views.append(view)
+        return other
+
+
 class Taxi:
-    loc: grid.Position
-    direction: Direction 
-    #has_passenger: bool = False
-    has_passenger: Passenger = None
+    """View of a taxi in a TaxiStore.
+
+    Taxis created directly get their own single entry store.
+    """
+
+    __slots__ = ("_store", "_index")
+
+    def __init__(
+        self,
+        loc: grid.Position,
+        direction: Direction,
+        has_passenger: Optional[Passenger] = None,
+        id: int = 0,
+        total_distance: int = 0,
+    ):
+        TaxiStore(capacity=1)._attach(self)
+        self._set(loc, direction, has_passenger, id, total_distance)
+
+    def _set(self, loc, direction, has_passenger, id, total_distance):
+        self.loc = loc
+        self.direction = direction
+        self.has_passenger = has_passenger
+        self.id = id
+        self.total_distance = total_distance
+
+    @property
+    def loc(self) -> grid.Position:
+        return self._store._get_position(0, self._index)
+
+    @loc.setter
+    def loc(self, p: grid.Position):
+        self._store._set_position(0, self._index, p)
+
+    @property
+    def direction(self) -> Direction:
+        return _DIRECTIONS[self._store.direction[self._index]]
+
+    @direction.setter
+    def direction(self, d: Direction):
+        self._store.direction[self._index] = d.value
+
+    @property
+    def has_passenger(self) -> Optional[Passenger]:
+        idx = self._store.passenger[self._index]
+        if idx < 0:
+            return None
+        return self._store.passengers.view(idx)
+
+    @has_passenger.setter
+    def has_passenger(self, p: Optional[Passenger]):
+        if p is None:
+            self._store.passenger[self._index] = -1
+            return
+        if self._store.passengers is None:
+            self._store.passengers = p._store
+        elif self._store.passengers is not p._store:
+            raise ValueError("Taxi passenger must belong to the passengers store of the taxi.")
+        self._store.passenger[self._index] = p._index
 
     # Id for agent identification
-    id: int = 0        
+    @property
+    def id(self) -> int:
+        return int(self._store.id[self._index])
+
+    @id.setter
+    def id(self, v: int):
+        self._store.id[self._index] = v
 
     # Taxi Metrics
-    total_distance: int = 0
+    @property
+    def total_distance(self) -> int:
+        return int(self._store.total_distance[self._index])
+
+    @total_distance.setter
+    def total_distance(self, v: int):
+        self._store.total_distance[self._index] = v
+
+    def __repr__(self) -> str:
+        return (
+            f"Taxi(loc={self.loc!r}, direction={self.direction!r}, has_passenger={self.has_passenger!r}, "
+            f"id={self.id!r}, total_distance={self.total_distance!r})"
+        )
 
     def pickup_up(self, passengers: list, env_grid: grid.Map):
         """
@@ -59,17 +392,18 @@ class Taxi:
             passenger.in_trip = TripState.INTRIP
             self.has_passenger = passenger
             return passenger
-            
+
         return None
 
 
-    def drop_off(self, env_grid: grid.Map):
+    def drop_off(self, env_grid: grid.Map, rng: np.random.Generator):
         """
-        Drops-Off Passenger in a nearby sidewalk if near one
+        Drops-Off Passenger in a nearby sidewalk if near one, drawn with
+        rng when the destination is not nearby
         """
-        
+
         if self.has_passenger != None:
-            drop_off = env_grid.choose_drop_location(self.loc, self.has_passenger.drop_off)
+            drop_off = env_grid.choose_drop_location(self.loc, self.has_passenger.drop_off, rng)
 
             if drop_off == None:
                 return None
@@ -78,7 +412,7 @@ class Taxi:
                 self.has_passenger.in_trip = TripState.WAITING
             else:
                 self.has_passenger.in_trip = TripState.FINISHED
-            
+
             self.has_passenger.pick_up = drop_off
             self.has_passenger = None
-        return None
\ No newline at end of file
+        return None
@@ -1,12 +1,14 @@
 import abc
+import collections
 import dataclasses
 import enum
 import grid
 import entity
 import log
 import numpy as np
+import scenario as scn
 
-from typing import List, Optional
+from typing import Deque, Dict, List, Optional, Tuple, Union
 
 
 @dataclasses.dataclass(frozen=True)
@@ -24,6 +26,65 @@ class Observation:
     taxis: List[entity.Taxi]
     passengers: List[entity.Passenger]
 
+@dataclasses.dataclass(frozen=True)
+class Frame:
+    """Immutable copy of the environment state for rendering.
+
+    The taxis and passengers are copies that are not modified by
+    later environment steps, so a frame can be safely handed over
+    to another thread.
+
+    Attributes:
+        map: map of the environment.
+        taxis: copies of the taxis.
+        passengers: copies of the passengers.
+        timestep: timestep when the frame was taken.
+        taxi_store: copy of the taxis store.
+        passenger_store: copy of the passengers store.
+        active_passengers: copy of the mask of the passengers in the
+            store still in the environment.
+    """
+
+    map: grid.Map
+    taxis: Tuple[entity.Taxi, ...]
+    passengers: Tuple[entity.Passenger, ...]
+    timestep: int
+    taxi_store: entity.TaxiStore
+    passenger_store: entity.PassengerStore
+    active_passengers: np.ndarray
+
+@dataclasses.dataclass(frozen=True)
+class Snapshot:
+    """Compact copy of the environment state for lookahead planning.
+
+    Snapshots are created with Environment.snapshot and restored with
+    Environment.restore. They hold copies of the taxi and passenger
+    stores arrays, so restoring a snapshot only copies arrays back
+    into the stores and does not create new entities.
+
+    Attributes:
+        timestep: timestep of the environment.
+        terminal: whether the environment was in a terminal state.
+        taxis: state of the taxis store.
+        passengers: state of the passengers store.
+        active: passengers still in the environment.
+        pending: passengers delivered in the last step, that are
+            removed in the next step.
+        final_passengers: (finished, 2) array with the pick-up and
+            travel times of the passengers already delivered.
+        rng_state: state of the environment random generator, which draws
+            the resets and the drop-offs away from the destination.
+    """
+
+    timestep: int
+    terminal: bool
+    taxis: np.ndarray
+    passengers: np.ndarray
+    active: np.ndarray
+    pending: np.ndarray
+    final_passengers: np.ndarray
+    rng_state: dict
+
 class Action(enum.Enum):
     """Specifies possible actions the taxis can perform."""
 
@@ -52,6 +113,19 @@ class Action(enum.Enum):
         return f"Action({self.name})"
 
 class Environment:
+    """Taxi environment.
+
+    With stall_window, the environment detects when its state repeats
+    within the last stall_window steps. The state hashed excludes the
+    timers and distances, which only grow. As the actions of
+    deterministic agents only depend on the state, the episode would
+    then cycle until the last timestep, so the remaining steps are
+    computed in closed form, the episode ends and stalled is set.
+    Detection must only be enabled when all the agents are deterministic.
+
+    States are only compared while no passenger changes, as drop-offs
+    away from the destination choose a random location.
+    """
 
     taxis: List[entity.Taxi]
     final_passengers: List[List[int]]
@@ -65,6 +139,7 @@ class Environment:
         log_level: Optional[str] = "info",
         max_timesteps: Optional[int] = 150,
         seed: Optional[int] = None,
+        stall_window: int = 0,
     ):
         self.map = map
         self._rng = np.random.default_rng(seed=seed)
@@ -75,8 +150,30 @@ class Environment:
         self._init_passengers = init_passengers
         self._max_timesteps = max_timesteps
 
-    def reset(self) -> List[Observation]:
-        self._reset()
+        # Cells changed with set_cell in the current episode, with
+        # their type before the change, reverted on reset.
+        self._changed_cells: Dict[grid.Position, grid.Cell] = {}
+
+        # Hashes of the taxis and passengers, whose xor is the state
+        # hash, and the recent states as (timestep, hash, taxis state).
+        self._stall_window = stall_window
+        self._taxi_hashes = np.zeros(0, dtype=np.uint64)
+        self._passenger_hashes = np.zeros(0, dtype=np.uint64)
+        self._state_hash = 0
+        self._history: Deque[Tuple[int, int, np.ndarray]] = collections.deque(maxlen=stall_window + 1)
+        self.stalled = False
+
+    def reset(self, scenario: "Optional[scn.Scenario]" = None) -> List[Observation]:
+        """Starts a new episode.
+
+        Args:
+            scenario: initial state of the episode. If None, the taxis
+                and passengers are placed with the environment random
+                generator.
+
+        Returns: List of observations for the agents.
+        """
+        self._reset(scenario)
         observation = Observation(map=self.map, taxis=self.taxis, passengers=self.passengers)
         return [observation for _ in range(len(self.taxis))]
 
@@ -106,7 +203,7 @@ class Environment:
             elif act == Action.PICK_UP:
                 taxi.pickup_up(self.passengers, self.map)
             elif act == Action.DROP_OFF:
-                taxi.drop_off(self.map)
+                taxi.drop_off(self.map, self._rng)
             elif act == Action.STAY:
                 # Do nothing
                 pass
@@ -117,16 +214,18 @@ class Environment:
 
         for passenger in self.passengers:
             log.passenger(self._logger, self._timestep, passenger)
-            
-            if passenger.in_trip == entity.TripState.WAITING:
-                passenger.pick_up_time += 1
-            elif passenger.in_trip == entity.TripState.INTRIP:
-                passenger.travel_time += 1
+
+        store = self._passenger_store
+        in_trip = store.in_trip[:store.size]
+        store.pick_up_time[:store.size] += self._active & (in_trip == entity.TripState.WAITING.value)
+        store.travel_time[:store.size] += self._active & (in_trip == entity.TripState.INTRIP.value)
 
         self._delete_passengers()
         observation = Observation(map=self.map, taxis=self.taxis, passengers=self.passengers)
 
         self.terminal = len(self.passengers) == 0 or self._timestep == self._max_timesteps
+        if self._stall_window and not self.terminal:
+            self.terminal = self._update_stall()
         # In the end, add the passengers that are not yet delivered to the list of final passengers
         # for metrics.
         if self.terminal:
@@ -134,54 +233,228 @@ class Environment:
 
         return [observation for _ in range(len(actions))], self.terminal
             
+    def fast_forward(self, routes: List[List[Action]], n_steps: int) -> List[Observation]:
+        """Advances the environment n_steps in closed form.
+
+        Each taxi performs the first n_steps actions of its route, which
+        must all be moves into road cells, or stays if its route is empty.
+        The result is the same as performing the steps one at a time, but
+        the positions, distances and passenger timers are updated with
+        a few array operations and the skipped steps are not logged.
+
+        No passenger can be waiting for deletion and the steps must end
+        before the last timestep, so that no event happens in between.
+
+        Returns: List of observations for the agents.
+        """
+        if len(routes) != len(self.taxis):
+            raise ValueError(f"Received {len(routes)} routes for {len(self.taxis)} taxis.")
+        if n_steps <= 0:
+            raise ValueError(f"Number of steps must be positive: {n_steps}")
+        if self._max_timesteps is not None and self._timestep + n_steps >= self._max_timesteps:
+            raise ValueError("Unable to fast-forward: the steps reach the last timestep.")
+        if self._pending.any():
+            raise ValueError("Unable to fast-forward: passengers are waiting for deletion.")
+
+        store = self._taxi_store
+        moving = [i for i, r in enumerate(routes) if r]
+        if moving:
+            moves = np.array([[a.value for a in routes[i][:n_steps]] for i in moving])
+            if moves.shape[1] != n_steps or not np.all(moves <= Action.RIGHT.value):
+                raise ValueError("Unable to fast-forward: routes must have n_steps moves.")
+            # Positions of each moving taxi after each of the moves.
+            xs = store.x[moving, None] + np.cumsum(_MOVE_DX[moves], axis=1)
+            ys = store.y[moving, None] + np.cumsum(_MOVE_DY[moves], axis=1)
+            if not np.all(self.map.road_mask[ys, xs]):
+                raise ValueError("Unable to fast-forward: routes must only move into roads.")
+            store.x[moving] = xs[:, -1]
+            store.y[moving] = ys[:, -1]
+            store.direction[moving] = _MOVE_DIRECTION[moves[:, -1]]
+            store.total_distance[moving] += n_steps
+            store.invalidate_positions(moving)
+
+        passengers = self._passenger_store
+        in_trip = passengers.in_trip[:passengers.size]
+        passengers.pick_up_time[:passengers.size] += n_steps * (self._active & (in_trip == entity.TripState.WAITING.value))
+        passengers.travel_time[:passengers.size] += n_steps * (self._active & (in_trip == entity.TripState.INTRIP.value))
+
+        self._timestep += n_steps
+        self._history.clear()
+        observation = Observation(map=self.map, taxis=self.taxis, passengers=self.passengers)
+        return [observation for _ in range(len(self.taxis))]
+
+    @property
+    def timestep(self) -> int:
+        return self._timestep
+
+    @property
+    def max_timesteps(self) -> int:
+        return self._max_timesteps
+
+    @property
+    def has_pending_passengers(self) -> bool:
+        """Whether there are delivered passengers to delete in the next step."""
+        return bool(self._pending.any())
+
     def render(self):
         if not self._printer:
             raise ValueError("Unable to render without printer")
         self._printer.print(self)
 
-    def _reset(self):
+    def frame(self) -> Frame:
+        """Copies the current state into a frame that can be rendered later."""
+        passengers = self._passenger_store.copy()
+        taxis = self._taxi_store.copy(passengers)
+        return Frame(
+            map=self.map,
+            taxis=tuple(taxis.views),
+            passengers=tuple(passengers.view(i) for i in np.flatnonzero(self._active)),
+            timestep=self._timestep,
+            taxi_store=taxis,
+            passenger_store=passengers,
+            active_passengers=self._active.copy(),
+        )
+
+    @property
+    def taxi_store(self) -> entity.TaxiStore:
+        """Arrays with the state of the taxis."""
+        return self._taxi_store
+
+    @property
+    def passenger_store(self) -> entity.PassengerStore:
+        """Arrays with the state of all the passengers created in the episode."""
+        return self._passenger_store
+
+    @property
+    def active_passengers(self) -> np.ndarray:
+        """Boolean mask of the passengers in the store still in the environment."""
+        return self._active
+
+    def snapshot(self) -> Snapshot:
+        """Saves the current state so that it can be restored later."""
+        return Snapshot(
+            timestep=self._timestep,
+            terminal=self.terminal,
+            taxis=self._taxi_store.state(),
+            passengers=self._passenger_store.state(),
+            active=self._active.copy(),
+            pending=self._pending.copy(),
+            final_passengers=np.array(self.final_passengers, dtype=np.int64).reshape(-1, 2),
+            rng_state=self._rng.bit_generator.state,
+        )
+
+    def restore(self, snapshot: Snapshot) -> List[Observation]:
+        """Restores a state saved with snapshot.
+
+        The snapshot must have been taken from an episode with the same
+        number of taxis and passengers. The snapshot is not modified, so
+        it can be restored multiple times.
+
+        Returns: List of observations for the agents.
+        """
+        self._taxi_store.set_state(snapshot.taxis)
+        self._passenger_store.set_state(snapshot.passengers)
+
+        self._timestep = snapshot.timestep
+        self.terminal = snapshot.terminal
+        if not np.array_equal(self._active, snapshot.active):
+            self._active[:] = snapshot.active
+            self._update_passengers()
+        self._pending[:] = snapshot.pending
+        self.final_passengers = snapshot.final_passengers.tolist()
+        self._rng.bit_generator.state = snapshot.rng_state
+        self.stalled = False
+        self._history.clear()
+
+        observation = Observation(map=self.map, taxis=self.taxis, passengers=self.passengers)
+        return [observation for _ in range(len(self.taxis))]
+
+    def set_cell(self, p: grid.Position, cell: grid.Cell):
+        """Changes a cell of the map during the episode, such as to close
+        a road. The changes are reverted when the environment is reset,
+        and are not saved in snapshots.
+
+        Roads with a taxi cannot be closed, and the pick-up and drop-off
+        locations of the passengers cannot become roads. Closing roads
+        that disconnect a passenger from a taxi makes the path based
+        agents fail when they look for a path to it.
+        """
+        if self.map.is_road(p) == (cell == grid.Cell.ROAD):
+            return
+        if cell == grid.Cell.SIDEWALK and any(t.loc == p for t in self.taxis):
+            raise ValueError(f"Unable to close road with a taxi: {p}")
+        if cell == grid.Cell.ROAD and any(
+            p in (passenger.pick_up, passenger.drop_off) for passenger in self.passengers
+        ):
+            raise ValueError(f"Unable to open road at a passenger location: {p}")
+        self._changed_cells.setdefault(p, grid.Cell.ROAD if self.map.is_road(p) else grid.Cell.SIDEWALK)
+        self.map.set_cell(p, cell)
+        log.set_cell(self._logger, self._timestep, p, cell)
+
+    def _reset(self, scenario: "Optional[scn.Scenario]" = None):
         self._timestep = 0
         self.terminal = False
 
-        self.taxis = []
-        self.final_passengers = []
+        for p, cell in self._changed_cells.items():
+            self.map.set_cell(p, cell)
+        self._changed_cells = {}
 
-        for i in range(self._init_taxis):
-            self.taxis.append(self._create_taxi(i))
+        self._passenger_store = entity.PassengerStore(self._init_passengers)
+        self._taxi_store = entity.TaxiStore(self._init_taxis, self._passenger_store)
 
+        self.taxis = []
+        self.final_passengers = []
         self.passengers = []
-        for i in range(self._init_passengers):
-            self.passengers.append(self._create_passenger(i))
-
-        self.passengers_travelling = [i for i in range(len(self.passengers))]
 
-    def _create_taxi(self, id: int) -> entity.Taxi:
-        """Creates a taxi with a random location and direction.
-        
-        The taxi initial location will not overlap with another taxi."""
-
-        occupied_locations = set()
-        for t in self.taxis:
-            occupied_locations.add(t.loc)
-
-        possible_taxi_locations = [
-            l
-            for l in self.map.possible_taxi_positions
-            if l not in occupied_locations
-        ]
-        if len(possible_taxi_locations) == 0:
+        # Without a scenario, the episode is a scenario drawn with the
+        # environment generator, with the draws of scenario.draw.
+        if scenario is None:
+            scenario = scn.draw(self._rng, self.map, self._init_taxis, self._init_passengers)
+        self._create_from_scenario(scenario)
+
+        # Passengers still in the environment and passengers delivered
+        # in the last step, that are only removed in the next step.
+        self._active = np.ones(len(self.passengers), dtype=bool)
+        self._pending = np.zeros(len(self.passengers), dtype=bool)
+
+        self.stalled = False
+        self._history.clear()
+        if self._stall_window:
+            self._taxi_hashes = self._hash_taxis()
+            self._passenger_hashes = self._hash_passengers()
+            self._state_hash = int(
+                np.bitwise_xor.reduce(self._taxi_hashes) ^ np.bitwise_xor.reduce(self._passenger_hashes)
+            )
+            self._history.append((self._timestep, self._state_hash, self._taxis_state()))
+
+    def _create_from_scenario(self, scenario: "scn.Scenario"):
+        """Creates the taxis and passengers in the first locations of the scenario."""
+        if self._init_taxis > scenario.max_taxis:
             raise ValueError("Unable to create taxi: Not enough free locations.")
-        loc = self._rng.choice(possible_taxi_locations)
-        possible_taxi_directions = [
-            entity.Direction.UP, 
-            entity.Direction.DOWN, 
-            entity.Direction.LEFT, 
-            entity.Direction.RIGHT,
-        ]
-        direction = self._rng.choice(possible_taxi_directions)
-        taxi = entity.Taxi(loc=loc, direction=direction, id=id)
-        log.create_taxi(self._logger, self._timestep, taxi)
-        return taxi
+        if self._init_passengers > scenario.max_passengers:
+            raise ValueError("Unable to create passenger: Not enough free locations.")
+
+        # The locations are gathered at once, as indexing the candidate
+        # arrays one location at a time is slower than creating the entities.
+        taxi_locations = self.map.taxi_positions(scenario.taxi_locations[:self._init_taxis])
+        for i in range(self._init_taxis):
+            taxi = self._taxi_store.add(
+                loc=taxi_locations[i],
+                direction=entity.Direction(int(scenario.taxi_directions[i])),
+                id=i,
+            )
+            log.create_taxi(self._logger, self._timestep, taxi)
+            self.taxis.append(taxi)
+
+        passenger_locations = self.map.passenger_positions(scenario.passenger_locations[:2 * self._init_passengers])
+        for i in range(self._init_passengers):
+            passenger = self._passenger_store.add(
+                pick_up=passenger_locations[2 * i],
+                drop_off=passenger_locations[2 * i + 1],
+                id=i,
+            )
+            log.create_passenger(self._logger, self._timestep, passenger)
+            self.passengers.append(passenger)
 
     def _move_taxi(self, taxi: entity.Taxi, action: Action):
         """Move a taxi according to an action while checking for sidewalks."""
@@ -207,52 +480,137 @@ class Environment:
         taxi.loc = target_loc
         taxi.direction = target_dir
 
-    def _create_passenger(self, id: int):
-        """Creates a passenger with random Pick-Up and Drop-Off locations.
-        
-        Both the passenger locations will not overlap with other passsenger
-        locations.
-        """
-
-        occupied_locations = set()
-        for p in self.passengers:
-            occupied_locations.add(p.pick_up)
-            occupied_locations.add(p.drop_off)
-
-        possible_passenger_locations = [
-            p 
-            for p in self.map.possible_passenger_positions 
-            if p not in occupied_locations
-        ]
-
-        
-        if len(possible_passenger_locations) < 2:
-            raise ValueError("Unable to create passenger: Not enough free locations.")
-        pick_up_loc = self._rng.choice(possible_passenger_locations)
-        possible_passenger_locations.remove(pick_up_loc)
-        drop_off_loc = self._rng.choice(possible_passenger_locations)
-        passenger = entity.Passenger(pick_up=pick_up_loc, drop_off=drop_off_loc, id=id)
-        log.create_passenger(self._logger, self._timestep, passenger)
-        return passenger
-
-
     def _delete_passengers(self):
         """
         Evaluates which passengers are in the corresponding drop-off locations.
         Deletes these passengers after one time-step.
         """
+        if self._pending.any():
+            self._active &= ~self._pending
+            self._update_passengers()
+
+        store = self._passenger_store
+        n = store.size
+        delivered = (store.pick_up_x[:n] == store.drop_off_x[:n]) & (store.pick_up_y[:n] == store.drop_off_y[:n])
+        self._pending = self._active & delivered
+        for i in np.flatnonzero(self._pending):
+            self.final_passengers += [[int(store.pick_up_time[i]), int(store.travel_time[i])]]
+
+    def _hash_taxis(self) -> np.ndarray:
+        store = self._taxi_store
+        n = store.size
+        return _hash_rows(_TAXIS_SALT, store.x[:n], store.y[:n], store.direction[:n], store.passenger[:n])
+
+    def _hash_passengers(self) -> np.ndarray:
+        store = self._passenger_store
+        m = store.size
+        return _hash_rows(
+            _PASSENGERS_SALT, store.in_trip[:m], store.pick_up_x[:m], store.pick_up_y[:m], self._active,
+        )
+
+    def _update_stall(self) -> bool:
+        """Updates the state hash with the entities that changed in the
+        step, and ends the episode if the state repeats.
+
+        Returns: Whether the episode stalled.
+        """
+        taxi_hashes = self._hash_taxis()
+        passenger_hashes = self._hash_passengers()
+        changed_passengers = passenger_hashes != self._passenger_hashes
+        changed_taxis = taxi_hashes != self._taxi_hashes
+        self._state_hash ^= int(
+            np.bitwise_xor.reduce(taxi_hashes[changed_taxis] ^ self._taxi_hashes[changed_taxis])
+            ^ np.bitwise_xor.reduce(passenger_hashes[changed_passengers] ^ self._passenger_hashes[changed_passengers])
+        )
+        self._taxi_hashes = taxi_hashes
+        self._passenger_hashes = passenger_hashes
+        if changed_passengers.any():
+            self._history.clear()
+
+        taxis = self._taxis_state()
+        for k, (_, state_hash, previous) in enumerate(self._history):
+            if state_hash == self._state_hash and np.array_equal(previous[:3], taxis[:3]):
+                self._skip_cycle(list(self._history)[k:], taxis)
+                return True
+        self._history.append((self._timestep, self._state_hash, taxis))
+        return False
+
+    def _taxis_state(self) -> np.ndarray:
+        """Positions, directions and distances of the taxis, as a (4, n) array."""
+        store = self._taxi_store
+        n = store.size
+        return np.stack([store.x[:n], store.y[:n], store.direction[:n], store.total_distance[:n]])
+
+    def _skip_cycle(self, cycle: List[Tuple[int, int, np.ndarray]], taxis: np.ndarray):
+        """Advances to the last timestep repeating the states of cycle,
+        whose first state is the current state, with taxis."""
+        length = self._timestep - cycle[0][0]
+        log.stall(self._logger, self._timestep, length)
+        self.stalled = True
+        if self._max_timesteps is None:
+            return
+
+        remaining = self._max_timesteps - self._timestep
+        n_cycles, rest = divmod(remaining, length)
+        start = cycle[0][2]
+        end = cycle[rest][2]
+
+        store = self._taxi_store
+        n = store.size
+        store.x[:n], store.y[:n], store.direction[:n] = end[0], end[1], end[2]
+        store.total_distance[:n] += n_cycles * (taxis[3] - start[3]) + (end[3] - start[3])
+        store.invalidate_positions()
+
+        passengers = self._passenger_store
+        in_trip = passengers.in_trip[:passengers.size]
+        passengers.pick_up_time[:passengers.size] += remaining * (self._active & (in_trip == entity.TripState.WAITING.value))
+        passengers.travel_time[:passengers.size] += remaining * (self._active & (in_trip == entity.TripState.INTRIP.value))
+        self._timestep = self._max_timesteps
+
+    def _update_passengers(self):
+        """Rebuilds the passengers list from the active passengers mask."""
+        self.passengers = [self._passenger_store.view(i) for i in np.flatnonzero(self._active)]
+
+
+# Salts of the hashes of the taxis and passengers states.
+_TAXIS_SALT = 0x9E3779B97F4A7C15
+_PASSENGERS_SALT = 0xC2B2AE3D27D4EB4F
+_FIELDS_MULTIPLIER = np.uint64(0x100000001B3)
+
+
+def _hash_rows(salt: int, *rows: np.ndarray) -> np.ndarray:
+    """Hashes the columns of the rows, one hash per entity index.
+
+    The fields are combined as a polynomial, with wrapping products,
+    and mixed once.
+    """
+    n = len(rows[0])
+    h = np.arange(n, dtype=np.uint64) * np.uint64(salt)
+    for row in rows:
+        h *= _FIELDS_MULTIPLIER
+        h += row.astype(np.uint64)
+    return _mix(h)
 
-        self.passengers = [self.passengers[i] for i in self.passengers_travelling]
 
-        self.passengers_travelling = []
-        for i in range(len(self.passengers)):
-            if self.passengers[i].pick_up != self.passengers[i].drop_off:
-                self.passengers_travelling.append(i)
-            else:
-                self.final_passengers += [[self.passengers[i].pick_up_time, self.passengers[i].travel_time]]
+def _mix(z: np.ndarray) -> np.ndarray:
+    # Finalizer of splitmix64. The products wrap around on overflow.
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+# Displacement and direction of the move actions, indexed by action value.
+_MOVE_DX = np.array([0, 0, -1, 1])
+_MOVE_DY = np.array([-1, 1, 0, 0])
+_MOVE_DIRECTION = np.array([
+    entity.Direction.UP.value,
+    entity.Direction.DOWN.value,
+    entity.Direction.LEFT.value,
+    entity.Direction.RIGHT.value,
+])
 
 
 class Printer(abc.ABC):
     @abc.abstractmethod
-    def print(self, env: Environment):
+    def print(self, env: Union[Environment, Frame]):
         pass
\ No newline at end of file
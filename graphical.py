@@ -4,99 +4,417 @@ import default
 import entity
 import env
 import grid
+import math
 import numpy as np
+import os
 import pygame
 
 
 
-from typing import Callable, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Images")
+
+MINIMAP_CELLS = 128
+"""Maximum width and height of the minimap in (downsampled) cells."""
+
+MINIMAP_SIZE = 160
+"""Maximum width and height of the minimap in pixels."""
+
+
+class Camera:
+    """Region of the map shown in the window.
+
+    The camera shows the cells from its upper left cell (x, y) that fit
+    in the view at the current cell size, in pixels. Zooming doubles or
+    halves the cell size, keeping the center of the view, and the view
+    never goes past the map limits.
+    """
+
+    MIN_CELL_SIZE = 4
+    MAX_CELL_SIZE = 128
+
+    def __init__(
+        self, map_width: int, map_height: int, view_width: int, view_height: int, cell_size: Optional[int] = None,
+    ):
+        self.map_width = map_width
+        self.map_height = map_height
+        self.view_width = view_width
+        self.view_height = view_height
+        self.x = 0
+        self.y = 0
+        self.cell_size = self.fit_cell_size() if cell_size is None else self._clamp_cell_size(cell_size)
+
+    def fit_cell_size(self) -> int:
+        """Largest cell size that shows the whole map, if allowed."""
+        return self._clamp_cell_size(min(self.view_width // self.map_width, self.view_height // self.map_height))
+
+    @property
+    def n_cols(self) -> int:
+        """Number of columns fully or partially visible."""
+        return math.ceil(self.view_width / self.cell_size)
+
+    @property
+    def n_rows(self) -> int:
+        """Number of rows fully or partially visible."""
+        return math.ceil(self.view_height / self.cell_size)
+
+    @property
+    def bounds(self) -> Tuple[int, int, int, int]:
+        """Visible cells as (x0, y0, x1, y1), with x1 and y1 excluded."""
+        return (
+            self.x,
+            self.y,
+            min(self.x + self.n_cols, self.map_width),
+            min(self.y + self.n_rows, self.map_height),
+        )
+
+    @property
+    def shows_whole_map(self) -> bool:
+        return self.bounds == (0, 0, self.map_width, self.map_height)
+
+    @property
+    def state(self) -> Tuple[int, int, int]:
+        return self.x, self.y, self.cell_size
+
+    def pan(self, dx: int, dy: int):
+        """Moves the view by dx columns and dy rows."""
+        self.x += dx
+        self.y += dy
+        self._clamp_position()
+
+    def zoom(self, steps: int):
+        """Doubles the cell size steps times, or halves it with negative steps."""
+        center_x = self.x + self.view_width / self.cell_size / 2
+        center_y = self.y + self.view_height / self.cell_size / 2
+        self.cell_size = self._clamp_cell_size(int(self.cell_size * 2 ** steps))
+        self.x = int(center_x - self.view_width / self.cell_size / 2)
+        self.y = int(center_y - self.view_height / self.cell_size / 2)
+        self._clamp_position()
+
+    def fit(self):
+        """Shows the whole map, or as much as the minimum cell size allows."""
+        self.cell_size = self.fit_cell_size()
+        self.x = self.y = 0
+
+    def _clamp_cell_size(self, cell_size: int) -> int:
+        return max(self.MIN_CELL_SIZE, min(self.MAX_CELL_SIZE, cell_size))
+
+    def _clamp_position(self):
+        # Only full cells are considered so the last row and column
+        # can be fully shown.
+        self.x = max(0, min(self.x, self.map_width - self.view_width // self.cell_size))
+        self.y = max(0, min(self.y, self.map_height - self.view_height // self.cell_size))
+
+
+class TileIndex:
+    """Buckets of entities by the square tile of the map that contains
+    their cell, so the entities in a region are found by only looking at
+    the tiles that overlap it.
+
+    The index is updated from the coordinate arrays of the stores, and
+    only the entities whose tile changed are moved between buckets,
+    which are few at each step as the entities move one cell at a time.
+    """
+
+    def __init__(self, map_width: int, tile_size: int = 16):
+        self._tile_size = tile_size
+        self._n_cols = math.ceil(map_width / tile_size)
+        # Tile of each entity, -1 for the entities not present.
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._buckets: Dict[int, Set[int]] = {}
+
+    def update(self, xs: np.ndarray, ys: np.ndarray, present: Optional[np.ndarray] = None):
+        """Sets the cells of the entities, indexed by their position in
+        the arrays. Entities not present are removed from the index."""
+        keys = (ys // self._tile_size).astype(np.int64) * self._n_cols + xs // self._tile_size
+        if present is not None:
+            keys = np.where(present, keys, -1)
+        old = self._keys
+        if len(old) != len(keys):
+            # Entities past the end of the arrays are removed, and new
+            # ones start outside the index.
+            for i in np.flatnonzero(old[len(keys):] >= 0).tolist():
+                self._move(len(keys) + i, int(old[len(keys) + i]), -1)
+            old = np.concatenate([old[:len(keys)], np.full(max(0, len(keys) - len(old)), -1, dtype=np.int64)])
+        changed = np.flatnonzero(keys != old)
+        for i, before, after in zip(changed.tolist(), old[changed].tolist(), keys[changed].tolist()):
+            self._move(i, before, after)
+        self._keys = keys
+
+    def query(self, x0: int, y0: int, x1: int, y1: int) -> np.ndarray:
+        """Sorted entities in the tiles that overlap the cells from
+        (x0, y0) to (x1, y1) excluded, which may be outside the cells."""
+        t = self._tile_size
+        entities: List[int] = []
+        for ty in range(y0 // t, (y1 - 1) // t + 1):
+            for tx in range(x0 // t, (x1 - 1) // t + 1):
+                entities.extend(self._buckets.get(ty * self._n_cols + tx, ()))
+        return np.sort(np.array(entities, dtype=np.intp))
+
+    def bucket(self, x: int, y: int) -> Set[int]:
+        """Entities in the tile of the cell (x, y)."""
+        t = self._tile_size
+        return self._buckets.get((y // t) * self._n_cols + x // t, set())
+
+    def _move(self, i: int, before: int, after: int):
+        if before >= 0:
+            bucket = self._buckets[before]
+            bucket.discard(i)
+            if not bucket:
+                del self._buckets[before]
+        if after >= 0:
+            self._buckets.setdefault(after, set()).add(i)
+
+
+class Sprites:
+    """Images loaded once and cached at each size they are drawn."""
+
+    def __init__(self, directory: str = IMAGES_DIR):
+        self._directory = directory
+        self._images: Dict[str, pygame.Surface] = {}
+        self._scaled: Dict[tuple, pygame.Surface] = {}
+
+    def get(self, name: str, width: int, height: int, angle: int = 0) -> pygame.Surface:
+        key = (name, width, height, angle)
+        if key not in self._scaled:
+            if name not in self._images:
+                self._images[name] = pygame.image.load(os.path.join(self._directory, name)).convert_alpha()
+            sprite = pygame.transform.scale(self._images[name], (width, height))
+            if angle != 0:
+                sprite = pygame.transform.rotate(sprite, angle)
+            self._scaled[key] = sprite
+        return self._scaled[key]
+
 
 class EnvironmentPrinter(env.Printer):
+    """Renders the environment through a camera.
+
+    Only the visible cells are drawn, and the map background is only
+    redrawn when the camera moves. The visible taxis and passengers are
+    found with tile indexes of their cells, so the cost of a frame
+    depends on the visible area and not on the map size or on the
+    number of taxis and passengers.
+
+    The camera is controlled with the arrows (pan), +/- or the mouse
+    wheel (zoom) and F (fit the map), and M toggles the minimap shown
+    when only part of the map is visible.
+    """
 
     def __init__(
         self,
-        grid: np.array
+        map: grid.Map,
+        cell_size: Optional[int] = None,
+        minimap: bool = True,
     ):
-        # Mapping between the passenger Drop-Off location
-        # and its colour.
+        """
+        Args:
+            map: map to render.
+            cell_size: initial cell size in pixels. None fits the whole
+                map in the window.
+            minimap: whether the minimap is initially shown.
+        """
+        # Mapping between the passenger Drop-Off location,
+        # as (x, y), and its colour.
         self._passenger_colours = {}
-        self.grid = grid
-        self._colour_picker = colour.Picker()
-
-    def print(self, env: env.Environment):
-        env_grid = env.map.grid
-        n_cols, n_rows = env_grid.shape
-        
-        assert self.__height % n_cols == 0, "display height is not divisible by number of columns in grid"
-        assert self.__width % n_rows == 0, "display width is not divisible by number of rows in grid"
-        
-        cell_height = self.__height // n_cols
-        cell_width = self.__width // n_rows
+        self._map_shape = (map.height, map.width)
+        self._taxi_index = TileIndex(map.width)
+        self._pick_up_index = TileIndex(map.width)
+        self._drop_off_index = TileIndex(map.width)
+        self._palette = colour.Palette()
+        self._cell_size = cell_size
+        self._show_minimap = minimap
+        self._sprites = Sprites()
+        self._background: Optional[pygame.Surface] = None
+        self._background_state = None
+        self._minimap_base: Optional[np.ndarray] = None
+        self._minimap_version = 0
+
+    @property
+    def camera(self) -> Camera:
+        return self.__camera
+
+    def handle_event(self, event: pygame.event.Event) -> bool:
+        """Applies the camera controls. Returns whether the event was used."""
+        if event.type == pygame.MOUSEWHEEL:
+            self.__camera.zoom(1 if event.y > 0 else -1)
+            return True
+        if event.type != pygame.KEYDOWN:
+            return False
+
+        step = max(1, self.__camera.n_cols // 8)
+        if event.key == pygame.K_LEFT:
+            self.__camera.pan(-step, 0)
+        elif event.key == pygame.K_RIGHT:
+            self.__camera.pan(step, 0)
+        elif event.key == pygame.K_UP:
+            self.__camera.pan(0, -step)
+        elif event.key == pygame.K_DOWN:
+            self.__camera.pan(0, step)
+        elif event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+            self.__camera.zoom(1)
+        elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+            self.__camera.zoom(-1)
+        elif event.key == pygame.K_f:
+            self.__camera.fit()
+        elif event.key == pygame.K_m:
+            self._show_minimap = not self._show_minimap
+        else:
+            return False
+        return True
+
+    def print(self, env: Union[env.Environment, env.Frame]):
+        camera = self.__camera
+        x0, y0, x1, y1 = camera.bounds
+        cell_size = camera.cell_size
 
         # Print roads and sidewalks
-        road_printer = RoadPrinter(
-            screen=self.__screen, cell_width=cell_width, cell_height=cell_height,
-        )
-        sidewalk_printer = SidewalkPrinter(
-            screen=self.__screen, cell_width=cell_width, cell_height=cell_height,
-        )
-
-        for pos in env.map.all_positions:
-            if env.map.is_road(pos):
-                road_printer.print(pos)
-            elif env.map.is_sidewalk(pos):
-                sidewalk_printer.print(pos)
-            else:
-                raise ValueError(f"Position not road or sidewalk: {pos}")
+        self.__screen.fill((0, 0, 0))
+        self.__screen.blit(self._get_background(env.map), (0, 0))
 
         # Print taxis
+        taxis = env.taxi_store
+        n = taxis.size
+        self._taxi_index.update(taxis.x[:n], taxis.y[:n])
+        candidates = self._taxi_index.query(x0, y0, x1, y1)
+        visible_taxis = candidates[_inside(taxis.x[candidates], taxis.y[candidates], x0, y0, x1, y1)]
         taxi_printer = TaxiPrinter(
             screen=self.__screen,
-            cell_width=cell_width,
-            cell_height=cell_height,
-            pick_colour_fn=self._pick_passenger_colour
+            cell_width=cell_size,
+            cell_height=cell_size,
+            pick_colour_fn=self._pick_passenger_colour,
+            sprites=self._sprites,
+            origin=(x0, y0),
         )
-        for t in env.taxis:
-            taxi_printer.print(t)
+        for i in visible_taxis.tolist():
+            taxi_printer.print(taxis.view(i))
 
         # Print passengers
-        self._remove_colours_for_disapeared_passengers(env.passengers)
-
+        passengers = env.passenger_store
+        m = passengers.size
+        active = env.active_passengers
+        self._pick_up_index.update(passengers.pick_up_x[:m], passengers.pick_up_y[:m], active)
+        self._drop_off_index.update(passengers.drop_off_x[:m], passengers.drop_off_y[:m], active)
+        self._remove_colours_for_disapeared_passengers(passengers.drop_off_x, passengers.drop_off_y)
+
+        candidates = np.union1d(
+            self._pick_up_index.query(x0, y0, x1, y1), self._drop_off_index.query(x0, y0, x1, y1),
+        ).astype(np.intp)
+        visible_passengers = candidates[
+            _inside(passengers.pick_up_x[candidates], passengers.pick_up_y[candidates], x0, y0, x1, y1)
+            | _inside(passengers.drop_off_x[candidates], passengers.drop_off_y[candidates], x0, y0, x1, y1)
+        ]
         pass_printer = PassengerPrinter(
-            screen=self.__screen, 
-            cell_width=cell_width, 
-            cell_height=cell_height,
+            screen=self.__screen,
+            cell_width=cell_size,
+            cell_height=cell_size,
             pick_colour_fn=self._pick_passenger_colour,
+            origin=(x0, y0),
         )
-        for p in env.passengers:
-            pass_printer.print(p)
+        for i in visible_passengers.tolist():
+            pass_printer.print(passengers.view(i))
+
+        if self._show_minimap and not camera.shows_whole_map:
+            self._print_minimap(env.map, taxis.x[:n], taxis.y[:n])
 
         pygame.display.flip()
 
-    def _remove_colours_for_disapeared_passengers(self, passengers: List[entity.Passenger]):
-        drop_off_locations = {p.drop_off for p in passengers}
+    def _get_background(self, map: grid.Map) -> pygame.Surface:
+        """Surface with the visible cells, redrawn only when the camera moves
+        or the cells change."""
+        state = (self.__camera.state, map.version)
+        if self._background is not None and self._background_state == state:
+            return self._background
+
+        x0, y0, x1, y1 = self.__camera.bounds
+        cell_size = self.__camera.cell_size
+        background = pygame.Surface(((x1 - x0) * cell_size, (y1 - y0) * cell_size))
+        road_printer = RoadPrinter(
+            screen=background, cell_width=cell_size, cell_height=cell_size, sprites=self._sprites, origin=(x0, y0),
+        )
+        sidewalk_printer = SidewalkPrinter(
+            screen=background, cell_width=cell_size, cell_height=cell_size, sprites=self._sprites, origin=(x0, y0),
+        )
+        road_mask = map.road_mask[y0:y1, x0:x1]
+        for y, x in zip(*(i.tolist() for i in np.nonzero(road_mask))):
+            road_printer.print(grid.Position(x=x + x0, y=y + y0))
+        for y, x in zip(*(i.tolist() for i in np.nonzero(~road_mask))):
+            sidewalk_printer.print(grid.Position(x=x + x0, y=y + y0))
+
+        self._background = background
+        self._background_state = state
+        return background
+
+    def _print_minimap(self, map: grid.Map, taxis_x: np.ndarray, taxis_y: np.ndarray):
+        """Prints a low resolution overview of the map in the upper right corner.
+
+        Each minimap cell covers a block of cells, and is a road if any
+        of them is a road. The taxis are drawn over the roads and the
+        camera view is outlined.
+        """
+        block = max(1, math.ceil(max(map.width, map.height) / MINIMAP_CELLS))
+        if self._minimap_base is None or self._minimap_version != map.version:
+            self._minimap_version = map.version
+            height = math.ceil(map.height / block) * block
+            width = math.ceil(map.width / block) * block
+            road_mask = np.zeros((height, width), dtype=bool)
+            road_mask[:map.height, :map.width] = map.road_mask
+            blocks = road_mask.reshape(height // block, block, width // block, block).any(axis=(1, 3))
+            # Surface arrays are indexed by (x, y).
+            self._minimap_base = np.where(
+                blocks.T[..., None], np.array(colour.ROADS[0]), np.array(colour.SIDEWALKS[0]),
+            ).astype(np.uint8)
+
+        pixels = self._minimap_base.copy()
+        pixels[taxis_x // block, taxis_y // block] = colour.TAXI[0]
+        surface = pygame.surfarray.make_surface(pixels)
+
+        scale = max(1, MINIMAP_SIZE // max(pixels.shape[:2]))
+        size = (pixels.shape[0] * scale, pixels.shape[1] * scale)
+        surface = pygame.transform.scale(surface, size)
+        x0, y0, x1, y1 = self.__camera.bounds
+        view = pygame.Rect(
+            x0 // block * scale, y0 // block * scale,
+            max(1, (x1 - x0) // block * scale), max(1, (y1 - y0) // block * scale),
+        )
+        pygame.draw.rect(surface, (255, 255, 255), view, 1)
+
+        left = self.__width - size[0] - 8
+        self.__screen.blit(surface, (left, 8))
+        pygame.draw.rect(self.__screen, (0, 0, 0), pygame.Rect(left - 1, 7, size[0] + 2, size[1] + 2), 1)
+
+    def _remove_colours_for_disapeared_passengers(self, drop_off_x: np.ndarray, drop_off_y: np.ndarray):
+        # Only the active passengers in the tile of each coloured
+        # location are checked, through the drop-off index.
         mark_for_delete = []
         for loc in self._passenger_colours:
-            if loc not in drop_off_locations:
+            x, y = loc
+            if not any(drop_off_x[i] == x and drop_off_y[i] == y for i in self._drop_off_index.bucket(x, y)):
                 mark_for_delete.append(loc)
         for loc in mark_for_delete:
-            del self._passenger_colours[loc]
+            self._palette.release(self._passenger_colours.pop(loc))
 
     def _pick_passenger_colour(self, p: entity.Passenger) -> colour.Colour:
-        drop_off_loc = p.drop_off
+        drop_off_loc = (p.drop_off.x, p.drop_off.y)
         if drop_off_loc in self._passenger_colours:
             return self._passenger_colours[drop_off_loc]
 
-        new_colour = self._colour_picker.random_not_close(
-            *colour.ROADS, *colour.SIDEWALKS, *colour.TAXI, *self._passenger_colours.values(),
-        )
+        new_colour = self._palette.acquire()
         self._passenger_colours[drop_off_loc] = new_colour
         return new_colour
 
     def __enter__(self):
         pygame.init()
-        n_cells = self.grid.shape[0] * self.grid.shape[1]
-        self.__width = self.__height = ((min(pygame.display.Info().current_w, pygame.display.Info().current_h) * 0.8) // n_cells) * n_cells
+        info = pygame.display.Info()
+        self.__width = self.__height = int(min(info.current_w, info.current_h) * 0.8)
+        n_rows, n_cols = self._map_shape
+        self.__camera = Camera(n_cols, n_rows, self.__width, self.__height, self._cell_size)
+        # Without a camera the window is shrunk to fit the map.
+        if self.__camera.shows_whole_map:
+            self.__width = n_cols * self.__camera.cell_size
+            self.__height = n_rows * self.__camera.cell_size
+            self.__camera.view_width = self.__width
+            self.__camera.view_height = self.__height
         self.__screen = pygame.display.set_mode((self.__width, self.__height))
         return self
 
@@ -105,15 +423,21 @@ class EnvironmentPrinter(env.Printer):
         return False
 
 
+def _inside(xs: np.ndarray, ys: np.ndarray, x0: int, y0: int, x1: int, y1: int) -> np.ndarray:
+    return (xs >= x0) & (xs < x1) & (ys >= y0) & (ys < y1)
+
+
 class BasePrinter:
-    def __init__(self, screen: pygame.Surface, cell_width: int, cell_height: int):
+    def __init__(self, screen: pygame.Surface, cell_width: int, cell_height: int, origin: Tuple[int, int] = (0, 0)):
         self._screen = screen
         self._cell_width = cell_width
         self._cell_height = cell_height
+        # Cell drawn in the upper left corner of the screen.
+        self._origin = origin
 
     def get_upper_left(self, pos: grid.Position) -> Tuple[int, int]:
         """Computes the upper left corner for a given position."""
-        return pos.x * self._cell_width, pos.y * self._cell_height
+        return (pos.x - self._origin[0]) * self._cell_width, (pos.y - self._origin[1]) * self._cell_height
 
     def get_cell_center(self, pos: grid.Position) -> Tuple[int, int]:
         """Computes the center pixels for a given position."""
@@ -122,68 +446,79 @@ class BasePrinter:
 
     def get_px_side(self):
         """Computes the pixelart pixel size."""
-        return int(self._cell_width // 16)
+        return max(1, int(self._cell_width // 16))
 
 
 class CellPrinter(abc.ABC, BasePrinter):
+    def __init__(
+        self,
+        screen: pygame.Surface,
+        cell_width: int,
+        cell_height: int,
+        sprites: Sprites,
+        origin: Tuple[int, int] = (0, 0),
+    ):
+        super().__init__(screen=screen, cell_width=cell_width, cell_height=cell_height, origin=origin)
+        self._sprites = sprites
+
     @abc.abstractmethod
     def colour(self):
         pass
 
     def print(self, pos: grid.Position) -> None:
         """Draws a rectangle of a given colour for the given position."""
-        left = pos.x * self._cell_width
-        top = pos.y * self._cell_height
         #Change function colour name
-        self._screen.blit(self.colour(), (left,top))
-        
+        self._screen.blit(self.colour(), self.get_upper_left(pos))
+
 
 class RoadPrinter(CellPrinter):
     def colour(self):
         #return colour.ROAD
-        return pygame.transform.scale(pygame.image.load("Images/estrada.png"), (self._cell_width, self._cell_height))
+        return self._sprites.get("estrada.png", self._cell_width, self._cell_height)
 
 class SidewalkPrinter(CellPrinter):
     def colour(self):
         #return colour.SIDEWALK
-        return pygame.transform.scale(pygame.image.load("Images/passeio.png"), (self._cell_width, self._cell_height))
+        return self._sprites.get("passeio.png", self._cell_width, self._cell_height)
 
 class TaxiPrinter(BasePrinter):
+
+    # Rotation of the taxi sprite for each direction.
+    ANGLES = {
+        entity.Direction.UP: 0,
+        entity.Direction.DOWN: -180,
+        entity.Direction.LEFT: 90,
+        entity.Direction.RIGHT: -90,
+    }
+
     def __init__(
         self,
         screen: pygame.Surface,
         cell_width: int,
         cell_height: int,
         pick_colour_fn: Callable[[entity.Passenger], colour.Colour],
+        sprites: Sprites,
+        origin: Tuple[int, int] = (0, 0),
     ):
-        super().__init__(screen=screen, cell_width=cell_width, cell_height=cell_height)
+        super().__init__(screen=screen, cell_width=cell_width, cell_height=cell_height, origin=origin)
         self._pick_fn = pick_colour_fn
+        self._sprites = sprites
 
 
     def print(self, taxi: entity.Taxi):
 
-        car = pygame.transform.scale(pygame.image.load("Images/taxi.png"), (0.8*self._cell_width, 0.8*self._cell_height))
-
-        left = taxi.loc.x * self._cell_width + 0.1 * self._cell_width
-        top = taxi.loc.y * self._cell_height + 0.1 * self._cell_height
+        taxi_sprite = self._sprites.get(
+            "taxi.png", int(0.8 * self._cell_width), int(0.8 * self._cell_height), self.ANGLES[taxi.direction],
+        )
 
-        if taxi.direction == entity.Direction.UP:
-            taxi_sprite = pygame.transform.rotate(car, 0)
-            
-        elif taxi.direction == entity.Direction.DOWN:
-            taxi_sprite = pygame.transform.rotate(car, -180)
-            
-        elif taxi.direction == entity.Direction.LEFT:
-            taxi_sprite = pygame.transform.rotate(car, 90)
-            
-        elif taxi.direction == entity.Direction.RIGHT:
-            taxi_sprite = pygame.transform.rotate(car, -90)
+        x, y = self.get_upper_left(taxi.loc)
+        left = x + 0.1 * self._cell_width
+        top = y + 0.1 * self._cell_height
 
         if taxi.has_passenger is not None:
             draw_colour = self._pick_fn(taxi.has_passenger)
             # taxi_center = self.get_cell_center(taxi.loc)
             # px_side = self.get_px_side()
-            x, y = self.get_upper_left(taxi.loc)
 
             taxi_rect = pygame.Rect(x, y, self._cell_width, self._cell_height)
             pygame.draw.rect(self._screen, draw_colour, taxi_rect)
@@ -202,13 +537,14 @@ class TaxiPrinter(BasePrinter):
 
 class PassengerPrinter(BasePrinter):
     def __init__(
-        self, 
-        screen: pygame.Surface, 
-        cell_width: int, 
-        cell_height: int, 
+        self,
+        screen: pygame.Surface,
+        cell_width: int,
+        cell_height: int,
         pick_colour_fn: Callable[[entity.Passenger], colour.Colour],
+        origin: Tuple[int, int] = (0, 0),
     ):
-        super().__init__(screen=screen, cell_width=cell_width, cell_height=cell_height)
+        super().__init__(screen=screen, cell_width=cell_width, cell_height=cell_height, origin=origin)
         self._pick_fn = pick_colour_fn
 
     def print(self, passenger: entity.Passenger):
@@ -238,11 +574,11 @@ class PassengerPrinter(BasePrinter):
 
 def draw_text(
     screen: pygame.Surface,
-    text: str, 
-    center: Tuple[int, int], 
-    color: Tuple[int, int, int], 
-    size: int, 
-    font: str = "arial", 
+    text: str,
+    center: Tuple[int, int],
+    color: Tuple[int, int, int],
+    size: int,
+    font: str = "arial",
     bold: bool = False,
 ):
     font = pygame.font.SysFont(font, size, bold)
@@ -250,4 +586,4 @@ def draw_text(
     rect = surf.get_rect()
     rect.center = center
 
-    screen.blit(surf, rect)
\ No newline at end of file
+    screen.blit(surf, rect)
@@ -1,9 +1,8 @@
 import dataclasses
 import enum
-import random
 import numpy as np
 
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 @dataclasses.dataclass(frozen=True)
 class Position:
@@ -63,47 +62,168 @@ class Cell(enum.Enum):
         return f"Cell({self.name})"
 
 class Map:
+    """Grid of roads and sidewalks.
+
+    The map is stored as a boolean road mask, and the candidate
+    locations of taxis (roads) and passengers (sidewalks next to a road)
+    are kept as (n, 2) arrays of (x, y) coordinates, in the same order
+    as all_positions. Maps loaded with mapfile use memory-mapped arrays.
+
+    Cells can be changed with set_cell, such as to close roads. Each
+    change increases version and is kept in a log, so the caches derived
+    from the map, such as routing.DistanceCache, catch up with
+    changes_since instead of being rebuilt.
+    """
 
     def __init__(self, grid: np.ndarray):
-        self.grid = grid
+        self._init(grid == Cell.ROAD)
+        self._grid = grid
+
+    @classmethod
+    def from_arrays(
+        cls,
+        road_mask: np.ndarray,
+        taxi_candidates: Optional[np.ndarray] = None,
+        passenger_candidates: Optional[np.ndarray] = None,
+    ) -> "Map":
+        """Creates a map from its road mask and, optionally, its candidate
+        locations, as computed by candidate_arrays."""
+        map = cls.__new__(cls)
+        map._init(road_mask, taxi_candidates, passenger_candidates)
+        map._grid = None
+        return map
+
+    def _init(
+        self,
+        road_mask: np.ndarray,
+        taxi_candidates: Optional[np.ndarray] = None,
+        passenger_candidates: Optional[np.ndarray] = None,
+    ):
+        # Boolean array that is True in the road cells.
+        self.road_mask = road_mask
+        # The candidate locations are computed once, as they are drawn
+        # from in every reset, and again only after the cells change.
+        if taxi_candidates is None or passenger_candidates is None:
+            taxi_candidates, passenger_candidates = candidate_arrays(road_mask)
+        self._taxi_candidates: Optional[np.ndarray] = taxi_candidates
+        self._passenger_candidates: Optional[np.ndarray] = passenger_candidates
+        self._taxi_positions: Optional[List[Position]] = None
+        self._passenger_positions: Optional[List[Position]] = None
+        # Positions of the candidates drawn so far, by index, as creating
+        # them is slower than looking them up in every reset.
+        self._taxi_memo: Dict[int, Position] = {}
+        self._passenger_memo: Dict[int, Position] = {}
+        # Directory of the compiled map, if it was loaded by mapfile.
+        self.source: Optional[str] = None
+        # Changed cells, as (position, new cell), in order.
+        self._changes: List[Tuple[Position, Cell]] = []
+        self._owns_mask = False
+
+    @property
+    def version(self) -> int:
+        """Number of cell changes since the map was created."""
+        return len(self._changes)
+
+    def changes_since(self, version: int) -> List[Tuple[Position, Cell]]:
+        """Cell changes made after version, as (position, new cell)."""
+        return self._changes[version:]
+
+    def set_cell(self, p: Position, cell: Cell):
+        """Changes the type of a cell, such as to close or open a road.
+
+        The map arrays are copied on the first change, as they may be
+        shared with other maps or memory-mapped from a compiled map.
+        """
+        if not self.is_inside_map(p):
+            raise ValueError(f"Position outside the map: {p}")
+        is_road = cell == Cell.ROAD
+        if self.road_mask[p.y, p.x] == is_road:
+            return
+        if not self._owns_mask:
+            self.road_mask = np.array(self.road_mask, dtype=bool)
+            self._owns_mask = True
+            # The compiled map no longer matches this map.
+            self.source = None
+        self.road_mask[p.y, p.x] = is_road
+        self._grid = None
+        self._taxi_candidates = None
+        self._passenger_candidates = None
+        self._taxi_positions = None
+        self._passenger_positions = None
+        self._taxi_memo.clear()
+        self._passenger_memo.clear()
+        self._changes.append((p, cell))
+
+    @property
+    def taxi_candidates(self) -> np.ndarray:
+        if self._taxi_candidates is None:
+            self._update_candidates()
+        return self._taxi_candidates
+
+    @property
+    def passenger_candidates(self) -> np.ndarray:
+        if self._passenger_candidates is None:
+            self._update_candidates()
+        return self._passenger_candidates
+
+    def _update_candidates(self):
+        self._taxi_candidates, self._passenger_candidates = candidate_arrays(self.road_mask)
+
+    @property
+    def grid(self) -> np.ndarray:
+        """Array of Cell values, only built when first needed."""
+        if self._grid is None:
+            self._grid = np.where(self.road_mask, Cell.ROAD, Cell.SIDEWALK)
+        return self._grid
 
     @property
     def height(self):
-        return self.grid.shape[0]
+        return self.road_mask.shape[0]
 
     @property
     def width(self):
-        return self.grid.shape[1]
+        return self.road_mask.shape[1]
 
     @property
     def all_positions(self) -> List[Position]:
-        positions = []
-        with np.nditer(self.grid, flags=["multi_index", "refs_ok"]) as it:
-            for _ in it:
-                y, x = it.multi_index
-                positions.append(Position(x=x, y=y))
-        return positions
+        return [Position(x=x, y=y) for y in range(self.height) for x in range(self.width)]
 
     @property
     def possible_taxi_positions(self) -> List[Position]:
-        return [p for p in self.all_positions if self.is_road(p)]
+        if self._taxi_positions is None:
+            self._taxi_positions = _positions(self.taxi_candidates)
+        return list(self._taxi_positions)
+
+    @property
+    def n_taxi_positions(self) -> int:
+        return len(self.taxi_candidates)
+
+    def taxi_positions(self, indexes: np.ndarray) -> List[Position]:
+        """Candidate taxi locations with the given indexes in possible_taxi_positions."""
+        return _memo_positions(self.taxi_candidates, self._taxi_memo, indexes)
 
     @property
     def possible_passenger_positions(self) -> List[Position]:
-        return [
-            p 
-            for p in self.all_positions 
-            if self.is_sidewalk(p) and self.has_adj_of_type(p, Cell.ROAD)
-        ]
+        if self._passenger_positions is None:
+            self._passenger_positions = _positions(self.passenger_candidates)
+        return list(self._passenger_positions)
+
+    @property
+    def n_passenger_positions(self) -> int:
+        return len(self.passenger_candidates)
+
+    def passenger_positions(self, indexes: np.ndarray) -> List[Position]:
+        """Candidate passenger locations with the given indexes in possible_passenger_positions."""
+        return _memo_positions(self.passenger_candidates, self._passenger_memo, indexes)
 
     def is_inside_map(self, p: Position) -> bool:
         return 0 <= p.y < self.height and 0 <= p.x < self.width
 
     def is_road(self, p: Position) -> bool:
-        return self.grid[p.y, p.x] == Cell.ROAD
+        return bool(self.road_mask[p.y, p.x])
 
     def is_sidewalk(self, p: Position) -> bool:
-        return self.grid[p.y, p.x] == Cell.SIDEWALK
+        return not self.road_mask[p.y, p.x]
 
     def adj_positions(self, p: Position, cell_type: Optional[Cell]) -> List[Position]:
         positions = [adj for adj in p.adj if self.is_inside_map(adj)]
@@ -142,11 +262,43 @@ class Map:
                
         return None
 
-    def choose_drop_location(self, p: Position, passenger_drop_off: Position) -> Position:
+    def choose_drop_location(
+        self, p: Position, passenger_drop_off: Position, rng: np.random.Generator,
+    ) -> Position:
+        """Chooses the destination if it is next to p, or else a random
+        sidewalk next to p drawn with rng. None if there is no sidewalk."""
         sidewalks_nearby = self.adj_positions(p, Cell.SIDEWALK)
  
         for sidewalk in sidewalks_nearby:
             if (sidewalk.x, sidewalk.y) == (passenger_drop_off.x, passenger_drop_off.y):
                 return sidewalk
 
-        return random.choice(sidewalks_nearby) if sidewalks_nearby else None
\ No newline at end of file
+        return sidewalks_nearby[rng.integers(len(sidewalks_nearby))] if sidewalks_nearby else None
+
+
+def candidate_arrays(road_mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Computes the candidate taxi and passenger locations of a road mask.
+
+    Returns: The (x, y) coordinates of the roads and of the sidewalks
+        next to a road, as (n, 2) arrays in row-major order.
+    """
+    padded = np.pad(road_mask, 1, constant_values=False)
+    adj_road = padded[:-2, 1:-1] | padded[2:, 1:-1] | padded[1:-1, :-2] | padded[1:-1, 2:]
+    taxis = np.argwhere(road_mask)[:, ::-1]
+    passengers = np.argwhere(~road_mask & adj_road)[:, ::-1]
+    return np.ascontiguousarray(taxis, dtype=np.int32), np.ascontiguousarray(passengers, dtype=np.int32)
+
+
+def _positions(candidates: np.ndarray) -> List[Position]:
+    return [Position(x=x, y=y) for x, y in candidates.tolist()]
+
+
+def _memo_positions(candidates: np.ndarray, memo: Dict[int, Position], indexes: np.ndarray) -> List[Position]:
+    positions = []
+    for i in indexes.tolist():
+        p = memo.get(i)
+        if p is None:
+            x, y = candidates[i].tolist()
+            p = memo[i] = Position(x=x, y=y)
+        positions.append(p)
+    return positions
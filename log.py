@@ -1,5 +1,6 @@
 import env
 import entity
+import grid
 import logging
 
 logging.basicConfig(format="t = %(timestep)s \t %(levelname)s \t %(name)s \t %(message)s")
@@ -18,6 +19,12 @@ def create_taxi(logger: logging.Logger, t: int, taxi: entity.Taxi):
 def create_passenger(logger: logging.Logger, t: int, passenger: entity.Passenger):
     logger.info("Created %r", passenger, extra={"timestep": t})
 
+def set_cell(logger: logging.Logger, t: int, p: "grid.Position", cell: "grid.Cell"):
+    logger.info("Changed %r to %r", p, cell, extra={"timestep": t})
+
+def stall(logger: logging.Logger, t: int, length: int):
+    logger.info("State repeated after %d steps, the episode stalled", length, extra={"timestep": t})
+
 def choosen_action(logger: logging.Logger, t: int, agent: int, action: "env.Action"):
     logger.info("Agent %d wants to %r", agent, action, extra={"timestep": t})
 
@@ -0,0 +1,154 @@
+import grid
+import hashlib
+import numpy as np
+import os
+import tempfile
+
+from typing import Dict, Optional
+
+ROAD_CHARS = ".0"
+"""Characters of the road cells in text maps."""
+
+SIDEWALK_CHARS = "#1"
+"""Characters of the sidewalk cells in text maps."""
+
+IMAGE_EXTENSIONS = (".png", ".bmp", ".gif", ".jpg", ".jpeg", ".tga")
+"""Extensions of the maps read as images, with one pixel per cell and
+dark pixels as roads."""
+
+CACHE_VERSION = 2
+"""Version of the cache layout. Caches of other versions are rebuilt."""
+
+_ARRAYS = ("road_mask", "taxi_candidates", "passenger_candidates")
+
+
+def load(path: str, cache_dir: Optional[str] = ".map_cache") -> grid.Map:
+    """Loads a map from a text or image file.
+
+    The first load compiles the map, with its candidate locations, into
+    .npy files in cache_dir. Later loads memory-map these files, so
+    large maps load without parsing and the processes that load the same
+    map share its pages through the page cache. The cache is rebuilt
+    when the source file changes.
+
+    Args:
+        path: text file, with one character per cell, or image file.
+        cache_dir: directory of the compiled maps, or None to parse the
+            file without caching.
+
+    Returns: The map. Maps loaded from the cache are read-only.
+    """
+    if cache_dir is None:
+        return grid.Map.from_arrays(parse(path))
+
+    directory = os.path.join(cache_dir, _cache_key(path))
+    if not os.path.isdir(directory):
+        compile(path, directory)
+    return load_compiled(directory)
+
+
+def load_compiled(directory: str) -> grid.Map:
+    """Memory-maps a map compiled by load, such as map.source."""
+    map = grid.Map.from_arrays(
+        *(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS)
+    )
+    map.source = directory
+    return map
+
+
+def compile(path: str, directory: str):
+    """Compiles a map file into the .npy files of directory."""
+    road_mask = parse(path)
+    taxis, passengers = grid.candidate_arrays(road_mask)
+    arrays = {"road_mask": road_mask, "taxi_candidates": taxis, "passenger_candidates": passengers}
+    _write_atomic(directory, arrays)
+
+
+def parse(path: str) -> np.ndarray:
+    """Reads the road mask of a text or image map file."""
+    if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+        return parse_image(path)
+    with open(path, "r") as fp:
+        return parse_text(fp.read())
+
+
+def parse_text(text: str) -> np.ndarray:
+    """Parses a text map, with one character per cell.
+
+    Roads are '.' or '0' and sidewalks '#' or '1'. Blank lines and lines
+    starting with ';' are ignored, all rows must have the same width and
+    the cells on the border must be sidewalks.
+    """
+    rows = [line.rstrip() for line in text.splitlines()]
+    rows = [row for row in rows if row and not row.startswith(";")]
+    if not rows:
+        raise ValueError("Empty map")
+    width = len(rows[0])
+    for i, row in enumerate(rows):
+        if len(row) != width:
+            raise ValueError(f"Row {i} has {len(row)} cells instead of {width}")
+        unknown = set(row) - set(ROAD_CHARS) - set(SIDEWALK_CHARS)
+        if unknown:
+            raise ValueError(f"Unknown cells in row {i}: {''.join(sorted(unknown))}")
+
+    chars = np.frombuffer("".join(rows).encode("ascii"), dtype=np.uint8).reshape(len(rows), width)
+    return _check_border(np.isin(chars, np.frombuffer(ROAD_CHARS.encode("ascii"), dtype=np.uint8)))
+
+
+def parse_image(path: str) -> np.ndarray:
+    """Reads an image map, with one pixel per cell.
+
+    Pixels darker than mid grey are roads and the others sidewalks. The
+    pixels on the border must be sidewalks.
+    """
+    # Only imported for image maps, as pygame is otherwise only needed
+    # by the graphical mode.
+    import pygame
+
+    surface = pygame.image.load(path)
+    # surfarray is indexed by (x, y).
+    rgb = pygame.surfarray.array3d(surface).transpose(1, 0, 2).astype(np.float32)
+    luminance = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    return _check_border(luminance < 128)
+
+
+def to_text(map: grid.Map) -> str:
+    """Text map of a map, as read by parse_text."""
+    return "\n".join("".join("." if road else "#" for road in row) for row in map.road_mask.tolist()) + "\n"
+
+
+def _check_border(road_mask: np.ndarray) -> np.ndarray:
+    # The taxis never leave the map because the map is surrounded by
+    # sidewalks, so the positions are not checked against its bounds.
+    border = np.zeros(road_mask.shape, dtype=bool)
+    border[[0, -1], :] = True
+    border[:, [0, -1]] = True
+    roads = np.argwhere(road_mask & border)
+    if len(roads):
+        y, x = roads[0]
+        raise ValueError(f"Map must be surrounded by sidewalks but has a road on its border at (x={x}, y={y})")
+    return road_mask
+
+
+def _cache_key(path: str) -> str:
+    stat = os.stat(path)
+    h = hashlib.sha256()
+    h.update(repr((CACHE_VERSION, os.path.abspath(path), stat.st_size, stat.st_mtime_ns)).encode())
+    return f"{os.path.splitext(os.path.basename(path))[0]}-{h.hexdigest()[:16]}"
+
+
+def _write_atomic(directory: str, arrays: Dict[str, np.ndarray]):
+    # The arrays are written to a temporary directory that is then
+    # renamed, so concurrent loads never see a partial cache.
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), array)
+    try:
+        os.rename(tmp, directory)
+    except OSError:
+        # Another process compiled the same map first.
+        for name in arrays:
+            os.remove(os.path.join(tmp, f"{name}.npy"))
+        os.rmdir(tmp)
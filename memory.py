@@ -0,0 +1,205 @@
+import functools
+import os
+import tracemalloc
+
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where the peak RSS is not sampled.
+    resource = None
+
+SUBSYSTEMS: Dict[str, Tuple[str, ...]] = {
+    "environment": ("env.py", "entity.py", "grid.py", "log.py", "mapfile.py", "scenario.py"),
+    "agents": ("agent.py", "parallel.py", "routing.py"),
+    "metrics": ("run.py", "store.py", "stats.py"),
+    "renderer": ("graphical.py", "colour.py"),
+}
+"""Source files of each subsystem. Allocations are attributed to the
+subsystem of the innermost frame in one of these files, and to other
+if there is none."""
+
+_SUBSYSTEM_OF_FILE = {f: name for name, files in SUBSYSTEMS.items() for f in files}
+
+_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+class EpisodeMemory(NamedTuple):
+    """Memory measured at the end of an episode, in bytes.
+
+    Attributes:
+        episode: index of the episode.
+        peak_rss: peak resident set size of the process so far, or
+            None if it cannot be sampled.
+        traced: memory allocated by Python and still in use.
+        traced_peak: peak of traced during the episode.
+        subsystems: traced memory still in use by each subsystem,
+            including other.
+        top_sites: allocation sites with the largest growth since the
+            previous episode, as (file:line, size difference, count difference).
+    """
+
+    episode: int
+    peak_rss: Optional[int]
+    traced: int
+    traced_peak: int
+    subsystems: Dict[str, int]
+    top_sites: List[Tuple[str, int, int]]
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident set size of the process in bytes."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS bytes.
+    return usage if os.uname().sysname == "Darwin" else usage * 1024
+
+
+class MemoryMonitor:
+    """Records the memory usage of the episodes of a sweep.
+
+    Python allocations are traced with tracemalloc, which slows down the
+    simulation, so the monitor is only meant to investigate memory
+    growth. Memory allocated outside Python, such as pygame surfaces, is
+    only visible in the peak RSS, and memory of the AgentPool workers is
+    not measured, as they run in other processes.
+    """
+
+    def __init__(self, top: int = 10, growth_runs: int = 5, nframes: int = 10):
+        """
+        Args:
+            top: number of allocation sites kept for each episode.
+            growth_runs: number of consecutive episodes that must grow
+                to flag monotonic growth.
+            nframes: frames stored in the allocation tracebacks, used to
+                find the subsystem of allocations in library code.
+        """
+        if growth_runs < 2:
+            raise ValueError(f"Growth requires at least 2 runs: {growth_runs}")
+        self._top = top
+        self._growth_runs = growth_runs
+        self._nframes = nframes
+        self._previous: Optional[tracemalloc.Snapshot] = None
+        self._started = False
+        self.episodes: List[EpisodeMemory] = []
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self._nframes)
+            self._started = True
+        self._previous = self._snapshot()
+        tracemalloc.reset_peak()
+
+    def stop(self):
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+        self._previous = None
+
+    def __enter__(self) -> "MemoryMonitor":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def record(self, episode: int) -> EpisodeMemory:
+        """Measures the memory at the end of an episode."""
+        traced, traced_peak = tracemalloc.get_traced_memory()
+        snapshot = self._snapshot()
+
+        subsystems = {name: 0 for name in (*SUBSYSTEMS, "other")}
+        for trace in snapshot.traces:
+            subsystems[_subsystem(trace.traceback)] += trace.size
+
+        top_sites = [
+            (f"{_relative(s.traceback[0].filename)}:{s.traceback[0].lineno}", s.size_diff, s.count_diff)
+            for s in snapshot.compare_to(self._previous, "lineno")[:self._top]
+        ]
+        self._previous = snapshot
+        tracemalloc.reset_peak()
+
+        memory = EpisodeMemory(
+            episode=episode,
+            peak_rss=peak_rss(),
+            traced=traced,
+            traced_peak=traced_peak,
+            subsystems=subsystems,
+            top_sites=top_sites,
+        )
+        self.episodes.append(memory)
+        return memory
+
+    def growing(self) -> List[str]:
+        """Measures that grew in each of the last growth_runs episodes.
+
+        The measures are traced, peak_rss and the subsystems.
+        """
+        if len(self.episodes) < self._growth_runs:
+            return []
+        last = self.episodes[-self._growth_runs:]
+        series = {"traced": [e.traced for e in last], "peak_rss": [e.peak_rss for e in last]}
+        series.update({name: [e.subsystems[name] for e in last] for name in last[0].subsystems})
+        return [name for name, values in series.items() if None not in values and _increasing(values)]
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        # The monitor own allocations would otherwise show as growth.
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+
+
+def format_episode(memory: EpisodeMemory) -> str:
+    rss = "n/a" if memory.peak_rss is None else _mb(memory.peak_rss)
+    subsystems = ", ".join(f"{name}={_mb(size)}" for name, size in memory.subsystems.items())
+    lines = [
+        f"Episode {memory.episode}: peak_rss={rss} traced={_mb(memory.traced)} "
+        f"traced_peak={_mb(memory.traced_peak)} ({subsystems})"
+    ]
+    for site, size_diff, count_diff in memory.top_sites:
+        lines.append(f"  {size_diff / 1024:+10.1f} KiB {count_diff:+8d} blocks  {site}")
+    return "\n".join(lines)
+
+
+def write_csv(path: str, episodes: Sequence[EpisodeMemory]):
+    """Writes the memory of each episode, one row per episode."""
+    names = list(episodes[0].subsystems) if episodes else [*SUBSYSTEMS, "other"]
+    with open(path, "w") as fp:
+        fp.write(",".join(["episode", "peak_rss", "traced", "traced_peak", *names]) + "\n")
+        for e in episodes:
+            row = [e.episode, "" if e.peak_rss is None else e.peak_rss, e.traced, e.traced_peak]
+            row.extend(e.subsystems[name] for name in names)
+            fp.write(",".join(str(v) for v in row) + "\n")
+
+
+def _subsystem(traceback: tracemalloc.Traceback) -> str:
+    # Frames are ordered from the oldest to the most recent.
+    for frame in reversed(traceback):
+        name = _subsystem_of_file(frame.filename)
+        if name is not None:
+            return name
+    return "other"
+
+
+@functools.lru_cache(maxsize=None)
+def _subsystem_of_file(filename: str) -> Optional[str]:
+    if os.path.dirname(filename) != _DIRECTORY:
+        return None
+    return _SUBSYSTEM_OF_FILE.get(os.path.basename(filename))
+
+
+def _increasing(values: Sequence[int]) -> bool:
+    return all(b > a for a, b in zip(values, values[1:]))
+
+
+def _relative(filename: str) -> str:
+    if os.path.dirname(filename) == _DIRECTORY:
+        return os.path.basename(filename)
+    return filename
+
+
+def _mb(size: int) -> str:
+    return f"{size / 2 ** 20:.1f}MiB"
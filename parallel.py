@@ -0,0 +1,265 @@
+import agent
+import collections
+import entity
+import env
+import grid
+import mapfile
+import multiprocessing
+import numpy as np
+import pickle
+import routing
+import time
+import traceback
+
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+SHARED_FIELDS_BYTES = 2 ** 28
+"""Maximum size of the distance fields shared with the workers."""
+
+
+class SharedArrays:
+    """Numpy arrays published through shared memory, read-only for the
+    workers.
+
+    The owner copies the arrays into shared memory blocks once, and the
+    workers attach to them by name with attach, so the arrays are never
+    pickled after the workers start. The owner may update the arrays
+    through arrays while the workers are not reading them.
+
+    Attributes:
+        arrays: writable views of the shared arrays, by name.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self._blocks = {}
+        self.arrays: Dict[str, np.ndarray] = {}
+        self.specs: Dict[str, Tuple[str, Tuple[int, ...], str]] = {}
+        for name, array in arrays.items():
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            shared[...] = array
+            self._blocks[name] = block
+            self.arrays[name] = shared
+            self.specs[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        # The views must be released before the blocks are closed.
+        self.arrays = {}
+        for block in self._blocks.values():
+            block.close()
+            block.unlink()
+        self._blocks = {}
+
+    @staticmethod
+    def attach(
+        specs: Dict[str, Tuple[str, Tuple[int, ...], str]],
+    ) -> Tuple[Dict[str, np.ndarray], List[shared_memory.SharedMemory]]:
+        """Attaches to arrays published by another process.
+
+        Returns: The read-only arrays and the blocks, which must be
+            kept alive while the arrays are in use.
+        """
+        arrays = {}
+        blocks = []
+        for name, (block_name, shape, dtype) in specs.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+            array.flags.writeable = False
+            arrays[name] = array
+            blocks.append(block)
+        return arrays, blocks
+
+
+class AgentPool(agent.FleetPolicy):
+    """Fleet policy that evaluates the decisions of the agents concurrently
+    in worker processes.
+
+    Each worker owns a fixed subset of the agents for the lifetime of
+    the pool, so the agents keep their internal state across steps and
+    episodes. The map is shared read-only through shared memory, or
+    through the page cache for compiled maps, and, at each step, only
+    the taxis and passengers of the observation are sent to the workers,
+    pickled once for all of them.
+
+    When the agents plan paths (agent.PathBased), the distance fields
+    of the pick-up locations of the waiting passengers are computed once
+    per step in the main process and published in a shared table of up
+    to shared_fields fields, so the workers read them instead of each
+    computing the same fields. A field is only copied into the table
+    when its target is new or the map changed. Fields for other targets
+    are computed by the workers.
+
+    The actions are always returned in the order of the agents and each
+    agent only sees its own state and the observation, so the actions
+    are the same as when the agents act sequentially in one process.
+    The agent objects in the main process are not updated.
+
+    Attributes:
+        busy_seconds: time each worker spent computing actions.
+        wall_seconds: time spent in act, which bounds the busy time of
+            each worker.
+    """
+
+    def __init__(self, agents: List[agent.Base], map: grid.Map, n_workers: int, shared_fields: int = 64):
+        if n_workers < 1:
+            raise ValueError(f"Number of workers must be positive: {n_workers}")
+        self.n_taxis = len(agents)
+        self.deterministic = all(a.deterministic for a in agents)
+        n_workers = min(n_workers, len(agents))
+
+        # Compiled maps are memory-mapped by the workers, sharing the
+        # page cache, and other maps are copied into shared memory.
+        arrays = {} if map.source is not None else {
+            "road_mask": map.road_mask,
+            "taxi_candidates": map.taxi_candidates,
+            "passenger_candidates": map.passenger_candidates,
+        }
+        # Slots of the shared distance fields, by target in least
+        # recently used order, and the map version written in each slot.
+        self._slots: "collections.OrderedDict[grid.Position, int]" = collections.OrderedDict()
+        self._slot_versions: List[int] = []
+        if any(isinstance(a, agent.PathBased) for a in agents):
+            field_bytes = np.dtype(np.int32).itemsize * map.height * map.width
+            n_slots = max(1, min(shared_fields, SHARED_FIELDS_BYTES // field_bytes))
+            arrays["fields"] = np.broadcast_to(
+                np.int32(routing.UNREACHABLE), (n_slots, map.height, map.width),
+            )
+            self._slot_versions = [-1] * n_slots
+        self._shared = SharedArrays(arrays)
+
+        ctx = multiprocessing.get_context()
+        self._workers = []
+        self._assignments = []
+        for w in range(n_workers):
+            indexes = list(range(w, len(agents), n_workers))
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(child_conn, map.source, self._shared.specs, [agents[i] for i in indexes]),
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self._workers.append((process, parent_conn))
+            self._assignments.append(indexes)
+        self.busy_seconds = [0.0] * n_workers
+        self.wall_seconds = 0.0
+        # Version of the map up to which the workers have its changes.
+        self._map_version = map.version
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ex_type, ex_val, ex_traceback) -> bool:
+        self.close()
+        return False
+
+    def act(self, obs: env.Observation) -> List[env.Action]:
+        start = time.perf_counter()
+        # Cell changes, such as road closures, are sent with the step
+        # and applied to the map of each worker.
+        changes = obs.map.changes_since(self._map_version)
+        self._map_version = obs.map.version
+        index = self._publish_fields(obs)
+        payload = pickle.dumps(
+            ("step", changes, obs.taxis, obs.passengers, index), protocol=pickle.HIGHEST_PROTOCOL,
+        )
+        for _, conn in self._workers:
+            conn.send_bytes(payload)
+
+        actions: List[Optional[env.Action]] = [None] * self.n_taxis
+        for w, ((_, conn), indexes) in enumerate(zip(self._workers, self._assignments)):
+            status, result, busy = conn.recv()
+            if status == "error":
+                raise RuntimeError(f"Agent worker failed:\n{result}")
+            self.busy_seconds[w] += busy
+            for i, value in zip(indexes, result):
+                actions[i] = env.Action(value)
+        self.wall_seconds += time.perf_counter() - start
+        return actions
+
+    def _publish_fields(self, obs: env.Observation) -> Dict[grid.Position, int]:
+        """Writes the distance fields of the pick-ups of the waiting
+        passengers into the shared table and returns their slots."""
+        if not self._slot_versions:
+            return {}
+        targets = list(dict.fromkeys(
+            p.pick_up for p in obs.passengers if p.in_trip == entity.TripState.WAITING
+        ))[:len(self._slot_versions)]
+        if not targets:
+            return {}
+
+        table = self._shared.arrays["fields"]
+        needed = set(targets)
+        index = {}
+        for target, field in zip(targets, routing.cache(obs.map).fields(targets)):
+            slot = self._slots.get(target)
+            if slot is None:
+                if len(self._slots) < len(self._slot_versions):
+                    slot = len(self._slots)
+                else:
+                    # The least recently used slot not needed in this step.
+                    slot = self._slots.pop(next(t for t in self._slots if t not in needed))
+                self._slots[target] = slot
+                self._slot_versions[slot] = -1
+            self._slots.move_to_end(target)
+            if self._slot_versions[slot] != obs.map.version:
+                table[slot] = field
+                self._slot_versions[slot] = obs.map.version
+            index[target] = slot
+        return index
+
+    def seed(self, seed: Optional[int]) -> None:
+        # The agents get the same seeds as when they act sequentially.
+        seeds = agent.agent_seeds(seed, self.n_taxis)
+        for (_, conn), indexes in zip(self._workers, self._assignments):
+            conn.send_bytes(pickle.dumps(("seed", [seeds[i] for i in indexes]), protocol=pickle.HIGHEST_PROTOCOL))
+
+    def close(self):
+        for process, conn in self._workers:
+            try:
+                conn.send_bytes(b"")
+            except (BrokenPipeError, OSError):
+                pass
+            conn.close()
+        for process, _ in self._workers:
+            process.join()
+        self._workers = []
+        self._shared.close()
+
+
+def _worker(conn, source: Optional[str], specs, agents: List[agent.Base]):
+    arrays, blocks = SharedArrays.attach(specs)
+    if source is not None:
+        map = mapfile.load_compiled(source)
+    else:
+        map = grid.Map.from_arrays(arrays["road_mask"], arrays["taxi_candidates"], arrays["passenger_candidates"])
+    try:
+        while True:
+            payload = conn.recv_bytes()
+            if not payload:
+                break
+            message = pickle.loads(payload)
+            if message[0] == "seed":
+                for a, seed in zip(agents, message[1]):
+                    a.seed(seed)
+                continue
+            _, changes, taxis, passengers, index = message
+            for p, cell in changes:
+                map.set_cell(p, cell)
+            # The shared fields are those of the map with the changes.
+            routing.cache(map).share({t: arrays["fields"][slot] for t, slot in index.items()}, map.version)
+            observation = env.Observation(map=map, taxis=taxis, passengers=passengers)
+            start = time.perf_counter()
+            try:
+                values = []
+                for a in agents:
+                    a.see(observation)
+                    values.append(a.act().value)
+                conn.send(("ok", values, time.perf_counter() - start))
+            except Exception:
+                conn.send(("error", traceback.format_exc(), time.perf_counter() - start))
+    finally:
+        for block in blocks:
+            block.close()
@@ -0,0 +1,239 @@
+import collections
+import grid
+import heapq
+import numpy as np
+import weakref
+
+from typing import Deque, Dict, List, Optional, Sequence, Set, Tuple
+
+UNREACHABLE = -1
+"""Distance of the cells from which the target cannot be reached."""
+
+_caches: "weakref.WeakKeyDictionary[grid.Map, DistanceCache]" = weakref.WeakKeyDictionary()
+
+Cell = Tuple[int, int]
+
+
+class DistanceCache:
+    """Distance fields of the targets of the agents, kept up to date with
+    the changes of the map.
+
+    The field of a target holds, for each road cell, the number of moves
+    to reach a road cell adjacent to the target, so the BFS path of
+    PathBased from a position has distance + 1 positions. The fields
+    missing in a query are computed together with wavefront the first
+    time their targets are queried and, when cells change, only the
+    distances that change are updated: opening a road propagates the
+    shorter distances from it, and closing a road finds the cells whose
+    shortest paths all went through it and recomputes only those.
+
+    The fields of the least recently queried targets are dropped when
+    they take more than max_bytes, but the fields of a query are always
+    kept until the next query.
+
+    Fields computed by another process, such as those published by
+    parallel.AgentPool, can be used instead of computing them with share.
+    """
+
+    def __init__(self, map: grid.Map, max_bytes: int = 2 ** 28):
+        self._map = map
+        self._max_fields = max(1, max_bytes // (np.dtype(np.int32).itemsize * map.height * map.width))
+        self._fields: "collections.OrderedDict[grid.Position, np.ndarray]" = collections.OrderedDict()
+        self._version = map.version
+        # Fields shared by another process, and the version of the map
+        # for which they are valid.
+        self._shared: Dict[grid.Position, np.ndarray] = {}
+        self._shared_version = -1
+
+    def distance(self, source: grid.Position, target: grid.Position) -> Optional[int]:
+        """Moves from source to a road adjacent to target, or None if it is unreachable."""
+        d = int(self.field(target)[source.y, source.x])
+        return None if d == UNREACHABLE else d
+
+    def field(self, target: grid.Position) -> np.ndarray:
+        """Distances of all the cells to target, UNREACHABLE for sidewalks."""
+        # The cached field is updated in place by later changes.
+        return self.fields([target])[0]
+
+    def matrix(self, sources: Sequence[grid.Position], targets: Sequence[grid.Position]) -> np.ndarray:
+        """Moves from each source to each target, as a (targets, sources)
+        array, UNREACHABLE where there is no path."""
+        fields = self.fields(targets)
+        ys = np.array([p.y for p in sources], dtype=np.intp)
+        xs = np.array([p.x for p in sources], dtype=np.intp)
+        matrix = np.empty((len(targets), len(sources)), dtype=np.int32)
+        for i, field in enumerate(fields):
+            matrix[i] = field[ys, xs]
+        return matrix
+
+    def fields(self, targets: Sequence[grid.Position]) -> List[np.ndarray]:
+        """Distance fields of the targets, computing the missing ones
+        together with wavefront."""
+        self.sync()
+        shared = self._shared if self._shared_version == self._map.version else {}
+        own = [t for t in targets if t not in shared]
+        missing = list(dict.fromkeys(t for t in own if t not in self._fields))
+        if missing:
+            for target, field in zip(missing, wavefront(self._map.road_mask, missing)):
+                # Copied so that dropping a field frees its memory.
+                self._fields[target] = field.copy()
+        fields = []
+        for target in targets:
+            if target in shared:
+                fields.append(shared[target])
+                continue
+            self._fields.move_to_end(target)
+            fields.append(self._fields[target])
+        while len(self._fields) > max(self._max_fields, len(own)):
+            self._fields.popitem(last=False)
+        return fields
+
+    def share(self, fields: Dict[grid.Position, np.ndarray], version: int):
+        """Uses fields computed by another process for their targets while
+        the map is at version, replacing the fields shared before.
+
+        The shared fields are not updated by the changes of the map and
+        their arrays may be reused for other targets after the next call.
+        """
+        self._shared = fields
+        self._shared_version = version
+
+    def sync(self):
+        """Applies the map changes made since the last query to the fields."""
+        if self._version == self._map.version:
+            return
+        road_mask = self._map.road_mask
+        for p, cell in self._map.changes_since(self._version):
+            for target, field in self._fields.items():
+                if cell == grid.Cell.ROAD:
+                    _open(road_mask, field, target, (p.y, p.x))
+                else:
+                    _close(road_mask, field, target, (p.y, p.x))
+        self._version = self._map.version
+
+
+def cache(map: grid.Map) -> DistanceCache:
+    """Distance cache shared by all the users of a map in this process."""
+    distances = _caches.get(map)
+    if distances is None:
+        distances = _caches[map] = DistanceCache(map)
+    return distances
+
+
+def wavefront(road_mask: np.ndarray, targets: Sequence[grid.Position]) -> np.ndarray:
+    """Computes the distance fields of many targets at once.
+
+    The frontiers of all the targets, starting at the roads adjacent to
+    each target, are expanded together by shifting them one cell in each
+    direction, so the number of iterations is the largest distance in
+    the fields, bounded by the diameter of the road network.
+
+    Returns: A (targets, height, width) array with the moves from each
+        cell to a road adjacent to each target, UNREACHABLE for the
+        sidewalks and the roads without a path.
+    """
+    height, width = road_mask.shape
+    shape = (len(targets), height, width)
+    fields = np.full(shape, UNREACHABLE, dtype=np.int32)
+    frontier = np.zeros(shape, dtype=bool)
+    for i, target in enumerate(targets):
+        for adj in target.adj:
+            if 0 <= adj.y < height and 0 <= adj.x < width:
+                frontier[i, adj.y, adj.x] = True
+    frontier &= road_mask
+    # Roads not reached yet, which the frontier can expand into.
+    unreached = np.broadcast_to(road_mask, shape) & ~frontier
+    expanded = np.empty(shape, dtype=bool)
+
+    distance = 0
+    while frontier.any():
+        np.copyto(fields, distance, where=frontier)
+        distance += 1
+        # Shifts of the frontier one cell down, up, right and left.
+        expanded[:, 1:, :] = frontier[:, :-1, :]
+        expanded[:, 0, :] = False
+        expanded[:, :-1, :] |= frontier[:, 1:, :]
+        expanded[:, :, 1:] |= frontier[:, :, :-1]
+        expanded[:, :, :-1] |= frontier[:, :, 1:]
+        expanded &= unreached
+        unreached ^= expanded
+        frontier, expanded = expanded, frontier
+    return fields
+
+
+def _neighbours(road_mask: np.ndarray, cell: Cell) -> List[Cell]:
+    y, x = cell
+    height, width = road_mask.shape
+    return [
+        (ny, nx) for ny, nx in ((y - 1, x), (y + 1, x), (y, x - 1), (y, x + 1))
+        if 0 <= ny < height and 0 <= nx < width and road_mask[ny, nx]
+    ]
+
+
+def _is_source(target: grid.Position, cell: Cell) -> bool:
+    return abs(cell[0] - target.y) + abs(cell[1] - target.x) == 1
+
+
+def _propagate(road_mask: np.ndarray, field: np.ndarray, queue: Deque[Cell]):
+    """Lowers the distances reachable from the cells in the queue,
+    which must be in increasing order of distance."""
+    while queue:
+        cell = queue.popleft()
+        d = field[cell] + 1
+        for n in _neighbours(road_mask, cell):
+            if field[n] == UNREACHABLE or field[n] > d:
+                field[n] = d
+                queue.append(n)
+
+
+def _open(road_mask: np.ndarray, field: np.ndarray, target: grid.Position, cell: Cell):
+    if _is_source(target, cell):
+        d = 0
+    else:
+        distances = [field[n] for n in _neighbours(road_mask, cell) if field[n] != UNREACHABLE]
+        if not distances:
+            return
+        d = min(distances) + 1
+    field[cell] = d
+    _propagate(road_mask, field, collections.deque([cell]))
+
+
+def _close(road_mask: np.ndarray, field: np.ndarray, target: grid.Position, cell: Cell):
+    old = field[cell]
+    field[cell] = UNREACHABLE
+    if old == UNREACHABLE:
+        return
+
+    # Cells are affected when none of their neighbours one move closer
+    # to the target keeps its distance. They are found level by level,
+    # so the neighbours closer to the target are always decided first.
+    affected: Set[Cell] = set()
+    level = old + 1
+    candidates = {n for n in _neighbours(road_mask, cell) if field[n] == level}
+    while candidates:
+        next_candidates: Set[Cell] = set()
+        for v in candidates:
+            if any(field[u] == level - 1 and u not in affected for u in _neighbours(road_mask, v)):
+                continue
+            affected.add(v)
+            next_candidates.update(n for n in _neighbours(road_mask, v) if field[n] == level + 1)
+        candidates = next_candidates
+        level += 1
+
+    # The affected cells get their distance from the unaffected cells
+    # around them, in increasing order of distance.
+    for v in affected:
+        field[v] = UNREACHABLE
+    heap: List[Tuple[int, Cell]] = []
+    for v in affected:
+        distances = [field[u] for u in _neighbours(road_mask, v) if u not in affected and field[u] != UNREACHABLE]
+        if distances:
+            heapq.heappush(heap, (min(distances) + 1, v))
+    while heap:
+        d, v = heapq.heappop(heap)
+        if field[v] != UNREACHABLE and field[v] <= d:
+            continue
+        field[v] = d
+        for n in _neighbours(road_mask, v):
+            if n in affected and (field[n] == UNREACHABLE or field[n] > d + 1):
+                heapq.heappush(heap, (d + 1, n))
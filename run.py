@@ -2,23 +2,53 @@ import agent
 import env
 import default
 import grid
-import graphical
+import mapfile
+import memory
 import numpy as np
-import pygame
-import yaml
-import tqdm
+import parallel
+import scenario as scn
+import stats
+import store
+import telemetry as tm
+import threading
+import time
 
 
-from typing import List
+from typing import List, Optional, Union
 
+# The runners accept either independent agents or a fleet policy.
+Agents = Union[List[agent.Base], agent.FleetPolicy]
 
-def run_graphical(map: grid.Map, agents: List[agent.Base], init_passengers: int, log_level: str):
-    with graphical.EnvironmentPrinter(map.grid) as printer:
+
+def run_graphical(
+    map: grid.Map,
+    agents: Agents,
+    init_passengers: int,
+    log_level: str,
+    seed: Optional[int] = None,
+    scenario: Optional[scn.Scenario] = None,
+    cell_size: Optional[int] = None,
+    minimap: bool = True,
+):
+    # Rendering is only imported when requested so that runs without
+    # graphics do not load pygame.
+    import graphical
+    import pygame
+
+    policy = agent.as_fleet(agents)
+    # The random decisions of the agents are seeded for each episode.
+    policy.seed(seed)
+    with graphical.EnvironmentPrinter(map, cell_size=cell_size, minimap=minimap) as printer:
         environment = env.Environment(
-            map=map, init_taxis=len(agents), init_passengers=init_passengers, printer=printer, log_level=log_level,
+            map=map,
+            init_taxis=policy.n_taxis,
+            init_passengers=init_passengers,
+            printer=printer,
+            log_level=log_level,
+            seed=seed,
         )
         # Initial render to see initial environment.
-        observations = environment.reset()
+        observations = environment.reset(scenario)
         environment.render()
         running = True
         n_steps = 0
@@ -26,11 +56,9 @@ def run_graphical(map: grid.Map, agents: List[agent.Base], init_passengers: int,
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
+                printer.handle_event(event)
 
-            for observations, agent in zip(observations, agents):
-                agent.see(observations)
-
-            actions = [a.act() for a in agents]
+            actions = policy.act(observations[0])
             observations, terminal = environment.step(*actions)
             n_steps += 1
             environment.render()
@@ -39,93 +67,438 @@ def run_graphical(map: grid.Map, agents: List[agent.Base], init_passengers: int,
 
             #time.sleep(1)
     n_delivered = len(environment.final_passengers) - len(environment.passengers)
-    return environment.taxis, environment.final_passengers, n_delivered, n_steps
+    return environment.taxis, environment.final_passengers, n_delivered, n_steps, environment.stalled
+
 
+def run_graphical_threaded(
+    map: grid.Map,
+    agents: Agents,
+    init_passengers: int,
+    log_level: str,
+    fps: int = 30,
+    steps_per_second: Optional[float] = None,
+    seed: Optional[int] = None,
+    scenario: Optional[scn.Scenario] = None,
+    cell_size: Optional[int] = None,
+    minimap: bool = True,
+):
+    """Runs the simulation in its own thread while the main thread renders.
 
-def run_not_graphical(map: grid.Map, agents: List[agent.Base], init_passengers: int, log_level: str):
+    The simulation thread publishes a frame after every step and the
+    main thread renders the latest frame at a fixed rate, while still
+    processing the window events. Slow agents no longer freeze the
+    window and slow frames no longer throttle the simulation.
+
+    Args:
+        fps: target frames per second of the render loop.
+        steps_per_second: simulation speed. None runs the simulation
+            as fast as possible.
+        scenario: initial state of the episode. None places the taxis
+            and passengers randomly.
+        cell_size: initial camera cell size in pixels. None fits the
+            whole map in the window.
+        minimap: whether the minimap is initially shown.
+    """
+    import graphical
+    import pygame
+
+    policy = agent.as_fleet(agents)
+    # The random decisions of the agents are seeded for each episode.
+    policy.seed(seed)
     environment = env.Environment(
-        map=map, init_taxis=len(agents), init_passengers=init_passengers, log_level=log_level,
+        map=map, init_taxis=policy.n_taxis, init_passengers=init_passengers, log_level=log_level, seed=seed,
     )
+    observations = environment.reset(scenario)
 
-    observations = environment.reset()
-    running = True
+    # The simulation thread only replaces these references and the
+    # render loop only reads them, so no lock is required.
+    latest = environment.frame()
     n_steps = 0
+    error = None
+    stop = threading.Event()
+
+    def simulate():
+        nonlocal latest, n_steps, error
+        period = 1 / steps_per_second if steps_per_second else None
+        next_step = time.perf_counter()
+        obs = observations
+        try:
+            while not stop.is_set():
+                actions = policy.act(obs[0])
+                obs, terminal = environment.step(*actions)
+                n_steps += 1
+                latest = environment.frame()
+                if terminal:
+                    break
+                if period is not None:
+                    next_step += period
+                    stop.wait(max(0, next_step - time.perf_counter()))
+        except Exception as e:
+            error = e
+
+    simulation = threading.Thread(target=simulate, name="simulation", daemon=True)
+    with graphical.EnvironmentPrinter(map, cell_size=cell_size, minimap=minimap) as printer:
+        clock = pygame.time.Clock()
+        simulation.start()
+        rendered = None
+        running = True
+        while running:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                # The camera moved, so the frame is rendered again.
+                if printer.handle_event(event):
+                    rendered = None
+
+            # Check before rendering so the final frame is always shown.
+            finished = not simulation.is_alive()
+            frame = latest
+            if frame is not rendered:
+                printer.print(frame)
+                rendered = frame
+            if finished:
+                break
+            clock.tick(fps)
+        stop.set()
+        simulation.join()
+
+    if error is not None:
+        raise error
+    n_delivered = len(environment.final_passengers) - len(environment.passengers)
+    return environment.taxis, environment.final_passengers, n_delivered, n_steps, environment.stalled
+
+
+def run_not_graphical(
+    map: grid.Map,
+    agents: Agents,
+    init_passengers: int,
+    log_level: str,
+    seed: Optional[int] = None,
+    scenario: Optional[scn.Scenario] = None,
+    telemetry: Optional[tm.Telemetry] = None,
+    stall_window: int = 0,
+):
+    """Runs the simulation step by step.
+
+    With stall_window and deterministic agents, the episode ends as
+    soon as the environment detects that its state cycles, as explained
+    in env.Environment.
+    """
+    policy = agent.as_fleet(agents)
+    # The random decisions of the agents are seeded for each episode.
+    policy.seed(seed)
+    environment = env.Environment(
+        map=map, init_taxis=policy.n_taxis, init_passengers=init_passengers, log_level=log_level, seed=seed,
+        stall_window=stall_window if policy.deterministic else 0,
+    )
+
+    observations = environment.reset(scenario)
+    running = True
     while running:
         
-        for observations, agent in zip(observations, agents):
-            agent.see(observations)
-        
-        actions = [a.act() for a in agents]
+        start = time.perf_counter()
+        actions = policy.act(observations[0])
+        acted = time.perf_counter()
         observations, terminal = environment.step(*actions)
-        n_steps += 1
+        if telemetry is not None:
+            telemetry.record_step(acted - start, time.perf_counter() - acted)
         if terminal:
             break
         #time.sleep(1)
     n_delivered = len(environment.final_passengers) - len(environment.passengers)
-    return environment.taxis, environment.final_passengers, n_delivered, n_steps
+    # Stalled episodes end at the last timestep without simulating the steps.
+    return environment.taxis, environment.final_passengers, n_delivered, environment.timestep, environment.stalled
 
-def main():
+def run_fast_forward(
+    map: grid.Map,
+    agents: Agents,
+    init_passengers: int,
+    log_level: str,
+    seed: Optional[int] = None,
+    scenario: Optional[scn.Scenario] = None,
+    telemetry: Optional[tm.Telemetry] = None,
+    stall_window: int = 0,
+):
+    """Runs the simulation jumping between events.
+
+    When all the agents commit to routes (agent.RouteBased), the clock
+    jumps directly to the step before the first taxi finishes its moves,
+    which is the next possible pick up or drop off, and the skipped steps
+    are computed in closed form. The steps with events are performed one
+    at a time, so the results are the same as with run_not_graphical.
+    Other agents and fleet policies are always simulated step by step,
+    and end early when the environment stalls, as in run_not_graphical.
+    """
+    policy = agent.as_fleet(agents)
+    # The random decisions of the agents are seeded for each episode.
+    policy.seed(seed)
+    environment = env.Environment(
+        map=map, init_taxis=policy.n_taxis, init_passengers=init_passengers, log_level=log_level, seed=seed,
+        stall_window=stall_window if policy.deterministic else 0,
+    )
+    agents = policy.agents if isinstance(policy, agent.PerAgent) else []
+    fast_forward = len(agents) > 0 and all(isinstance(a, agent.RouteBased) for a in agents)
+
+    observations = environment.reset(scenario)
+    while True:
+        if fast_forward and not environment.has_pending_passengers:
+            start = time.perf_counter()
+            for observation, a in zip(observations, agents):
+                a.see(observation)
+            routes = [a.plan() for a in agents]
+            planned = time.perf_counter()
+            # Taxis without a route stay until an event happens.
+            n_moves = min((len(r) - 1 for r in routes if r), default=np.inf)
+            if environment.max_timesteps is not None:
+                n_moves = min(n_moves, environment.max_timesteps - environment.timestep - 1)
+            if 0 < n_moves < np.inf:
+                n_moves = int(n_moves)
+                observations = environment.fast_forward(routes, n_moves)
+                for a in agents:
+                    a.advance(n_moves)
+                if telemetry is not None:
+                    telemetry.record_step(planned - start, time.perf_counter() - planned, n_moves)
 
+        start = time.perf_counter()
+        actions = policy.act(observations[0])
+        acted = time.perf_counter()
+        observations, terminal = environment.step(*actions)
+        if telemetry is not None:
+            telemetry.record_step(acted - start, time.perf_counter() - acted)
+        if terminal:
+            break
+    n_delivered = len(environment.final_passengers) - len(environment.passengers)
+    return environment.taxis, environment.final_passengers, n_delivered, environment.timestep, environment.stalled
+
+
+def main():
+    import yaml
 
     with open("./config.yml", "r") as fp:
         data = yaml.safe_load(fp)
 
     num_agents = data[data["agent_type"]]["nr_agents"]
     init_passengers = data[data["agent_type"]]["nr_passengers"]
-    
-    if data["agent_type"] == "Random":
-        agents = [agent.Random() for i in range(num_agents)]
-    elif data["agent_type"] == "PathPlanner":
-        agents = [agent.PathPlanner(agent_id=i) for i in range(num_agents)]
-    elif data["agent_type"] == "QuadrantsSocialConventions":
-        agents = [agent.QuadrantsSocialConventions(agent_id=i) for i in range(num_agents)]
-    elif data["agent_type"] == "IDsSocialConventions":
-        agents = [agent.IDsSocialConventions(agent_id=i) for i in range(num_agents)]
-    elif data["agent_type"] == "Roles":
-        agents = [agent.Roles(agent_id=i) for i in range(num_agents)]
-    elif data["agent_type"] == "Debug":
-        agents = [agent.Debug(agent_id=i) for i in range(num_agents)]
-
-
-    map = grid.Map(default.MAP)
+    agents = agent.create(data["agent_type"], num_agents, seed=data.get("seed"))
+
+    map_path = data.get("map")
+    if map_path is None:
+        map = grid.Map(default.MAP)
+    else:
+        map = mapfile.load(map_path, cache_dir=data.get("map_cache_dir", ".map_cache"))
 
     run_with_graphics = data["graphical"]
+    threaded_rendering = data.get("threaded_rendering", False)
+    render_fps = data.get("render_fps", 30)
+    sim_steps_per_second = data.get("sim_steps_per_second")
+    camera = data.get("camera") or {}
     log_level = data["log_level"]
     n_runs = data["n_runs"]
+    n_workers = data.get("n_workers", 1)
+    seed = data.get("seed")
+    scenario_seed = data.get("scenario_seed")
+    results_dir = data.get("results_dir")
+    use_fast_forward = data.get("fast_forward", False)
+    early_stopping = data.get("early_stopping") or {}
+    memory_profiling = data.get("memory_profiling") or {}
+    decision_budget_ms = data.get("decision_budget_ms")
+    telemetry_config = data.get("telemetry") or {}
+    stall_window = data.get("stall_window") or 0
+
+    # With early stopping, runs are performed until the metrics
+    # converge, up to max_runs, instead of exactly n_runs.
+    stopper = None
+    if early_stopping.get("enabled", False):
+        stopper = stats.SequentialStopper(
+            metrics=early_stopping.get("metrics", ["pick_up_time", "n_steps", "taxi_distance"]),
+            rel_tol=early_stopping.get("rel_tol", 0.05),
+            abs_tol=early_stopping.get("abs_tol", 0.01),
+            min_runs=early_stopping.get("min_runs", 10),
+            max_runs=early_stopping.get("max_runs", n_runs),
+            confidence=early_stopping.get("confidence", 0.95),
+        )
+        n_runs = early_stopping.get("max_runs", n_runs)
 
     taxis_distances = []
     pick_up_times = []
     drop_off_times = []
     all_n_delivered = []
     all_n_steps = []
+    all_stalled = []
 
+    # The progress bar is only imported when it is shown.
     if run_with_graphics:
         iterable = range(n_runs)
+        write = print
     else:
+        import tqdm
         iterable = tqdm.tqdm(range(n_runs))
-    
-    for _ in iterable:
-        if run_with_graphics:
-            taxis, passengers, n_delivered, n_steps = run_graphical(map, agents, init_passengers, log_level)
+        write = tqdm.tqdm.write
+
+    # The pool lives for the whole sweep, as the agents are also
+    # reused between runs when acting sequentially.
+    pool = None
+    if n_workers > 1 and not run_with_graphics and not isinstance(agents, agent.FleetPolicy):
+        pool = parallel.AgentPool(agents, map, n_workers)
+        agents = pool
+
+    # The telemetry server exposes live counters of the sweep.
+    counters = None
+    server = None
+    if telemetry_config.get("enabled", False) and not run_with_graphics:
+        counters = tm.Telemetry(data["agent_type"])
+        counters.pool = pool
+        server = tm.TelemetryServer(counters, port=telemetry_config.get("port", 9100))
+        server.start()
+
+    # With a decision budget, the decisions of each taxi are bounded in
+    # time and their latencies are reported at the end.
+    budget = None
+    if decision_budget_ms is not None:
+        budget = agent.DecisionBudget(agents, decision_budget_ms / 1000)
+        agents = budget
+
+    # Episodes already computed for this configuration are loaded
+    # from the store instead of being simulated again. Only seeded runs
+    # are stored, as unseeded runs must draw new episodes, and not runs
+    # with a decision budget, as their decisions depend on the time
+    # they take.
+    results = None
+    completed = {}
+    if results_dir is not None and seed is not None and not run_with_graphics and budget is None:
+        results = store.ResultStore(results_dir)
+        key = results.key(
+            data["agent_type"], num_agents, init_passengers, map, seed, scenario_seed, stall_window=stall_window,
+        )
+        completed = results.load(key)
+
+    # With a scenario seed, episode i starts from the same scenario for
+    # every agent type, so their metrics can be compared in pairs.
+    scenarios = None if scenario_seed is None else scn.ScenarioGenerator(map, scenario_seed)
+
+    # Memory profiling records the memory after each run to find
+    # what grows during long sweeps.
+    monitor = None
+    warned = []
+    growth_runs = memory_profiling.get("growth_runs", 5)
+    report_every = memory_profiling.get("report_every", 0)
+    if memory_profiling.get("enabled", False):
+        monitor = memory.MemoryMonitor(top=memory_profiling.get("top", 10), growth_runs=growth_runs)
+        monitor.start()
+
+    for i in iterable:
+        episode_seed = None if seed is None else seed + i
+        scenario = None if scenarios is None else scenarios.scenario(i)
+        if i in completed:
+            metrics = completed[i]
         else:
-            taxis, passengers, n_delivered, n_steps = run_not_graphical(map, agents, init_passengers, log_level)
+            if run_with_graphics and threaded_rendering:
+                taxis, passengers, n_delivered, n_steps, stalled = run_graphical_threaded(
+                    map,
+                    agents,
+                    init_passengers,
+                    log_level,
+                    fps=render_fps,
+                    steps_per_second=sim_steps_per_second,
+                    seed=episode_seed,
+                    scenario=scenario,
+                    cell_size=camera.get("cell_size"),
+                    minimap=camera.get("minimap", True),
+                )
+            elif run_with_graphics:
+                taxis, passengers, n_delivered, n_steps, stalled = run_graphical(
+                    map,
+                    agents,
+                    init_passengers,
+                    log_level,
+                    seed=episode_seed,
+                    scenario=scenario,
+                    cell_size=camera.get("cell_size"),
+                    minimap=camera.get("minimap", True),
+                )
+            elif use_fast_forward:
+                taxis, passengers, n_delivered, n_steps, stalled = run_fast_forward(
+                    map, agents, init_passengers, log_level, seed=episode_seed, scenario=scenario, telemetry=counters,
+                    stall_window=stall_window,
+                )
+            else:
+                taxis, passengers, n_delivered, n_steps, stalled = run_not_graphical(
+                    map, agents, init_passengers, log_level, seed=episode_seed, scenario=scenario, telemetry=counters,
+                    stall_window=stall_window,
+                )
+
+            metrics = store.Metrics(
+                taxi_distance=float(np.mean([taxi.total_distance for taxi in taxis])),
+                pick_up_time=float(np.mean([p[0] for p in passengers])),
+                drop_off_time=float(np.mean([p[1] for p in passengers])),
+                n_delivered=n_delivered,
+                n_steps=n_steps,
+                stalled=stalled,
+            )
+            if results is not None:
+                results.append(key, i, metrics)
 
-        avg_taxi_distance = np.mean([taxi.total_distance for taxi in taxis])
-        avg_pick_up = np.mean([p[0] for p in passengers])
-        avg_drop_off = np.mean([p[1] for p in passengers])
+        taxis_distances.append(metrics.taxi_distance)
+        pick_up_times.append(metrics.pick_up_time)
+        drop_off_times.append(metrics.drop_off_time)
+        all_n_delivered.append(metrics.n_delivered)
+        all_n_steps.append(metrics.n_steps)
+        all_stalled.append(metrics.stalled)
+
+        if counters is not None:
+            counters.record_episode()
+
+        if monitor is not None:
+            episode_memory = monitor.record(i)
+            if report_every and i % report_every == 0:
+                write(memory.format_episode(episode_memory))
+            # Only warns when the growing measures change, as some, such as
+            # the metrics lists, grow by design.
+            growing = monitor.growing()
+            if growing and growing != warned:
+                write(f"Memory grew in each of the last {growth_runs} runs: {', '.join(growing)}")
+            warned = growing
+
+        if stopper is not None:
+            stopper.add(metrics._asdict())
+            if stopper.done:
+                break
 
-        taxis_distances.append(avg_taxi_distance)
-        pick_up_times.append(avg_pick_up)
-        drop_off_times.append(avg_drop_off)
-        all_n_delivered.append(n_delivered)
-        all_n_steps.append(n_steps)
+    if pool is not None:
+        pool.close()
+
+    if server is not None:
+        server.close()
+
+    if monitor is not None:
+        monitor.stop()
+        memory.write_csv(
+            f"memory-{data['agent_type']}-agents-{num_agents}-passengers-{init_passengers}.csv", monitor.episodes,
+        )
+
+    if budget is not None:
+        p50, p90, p99 = (1000 * p for p in budget.percentiles((50, 90, 99)))
+        print(
+            f"{budget.n_decisions} decisions, {budget.misses} deadline misses of {decision_budget_ms}ms, "
+            f"latency p50={p50:.3f}ms p90={p90:.3f}ms p99={p99:.3f}ms"
+        )
+
+    if stopper is not None:
+        intervals = ", ".join(f"{m}={mean:.3f}±{hw:.3f}" for m, (mean, hw) in stopper.intervals().items())
+        status = "converged" if stopper.converged else "did not converge"
+        print(
+            f"{data['agent_type']} with {num_agents} agents and {init_passengers} passengers "
+            f"{status} after {stopper.n_runs} runs: {intervals}"
+        )
 
     # Stores each run in the following format
-    # n_agents, n_passengers, avg_taxi_distance, avg_pick_up_time, avg_drop_off_time, avg_n_steps
+    # n_agents, n_passengers, avg_taxi_distance, avg_pick_up_time, avg_drop_off_time, avg_n_steps, stalled
     with open(f"metrics-{data['agent_type']}-agents-{num_agents}-passengers-{init_passengers}.csv", "w") as metrics:
-        metrics.write("taxi_distance,pick_up_time,drop_off_time,n_delivered,n_steps\n")
-        for t, p, d, a, n in zip(taxis_distances, pick_up_times, drop_off_times, all_n_delivered, all_n_steps):
-            metrics.write(f"{t},{p},{d},{a},{n}\n")
+        metrics.write("taxi_distance,pick_up_time,drop_off_time,n_delivered,n_steps,stalled\n")
+        for t, p, d, a, n, s in zip(
+            taxis_distances, pick_up_times, drop_off_times, all_n_delivered, all_n_steps, all_stalled,
+        ):
+            metrics.write(f"{t},{p},{d},{a},{n},{int(s)}\n")
 
 
 
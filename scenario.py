@@ -0,0 +1,82 @@
+import dataclasses
+import grid
+import numpy as np
+
+
+@dataclasses.dataclass(frozen=True)
+class Scenario:
+    """Initial state of an episode, shared by any number of taxis and passengers.
+
+    The scenario stores a random order of all the candidate locations.
+    An episode with n taxis places them in the first n taxi locations
+    and an episode with m passengers uses the first 2m passenger
+    locations as (pick-up, drop-off) pairs. Episodes with different
+    agents, or with more or less entities, therefore start from the
+    same, or overlapping, initial states.
+
+    Attributes:
+        taxi_locations: permutation of the indexes of map.possible_taxi_positions.
+        taxi_directions: direction values for the taxis, in the same order.
+        passenger_locations: permutation of the indexes of map.possible_passenger_positions.
+    """
+
+    taxi_locations: np.ndarray
+    taxi_directions: np.ndarray
+    passenger_locations: np.ndarray
+
+    @property
+    def max_taxis(self) -> int:
+        return len(self.taxi_locations)
+
+    @property
+    def max_passengers(self) -> int:
+        return len(self.passenger_locations) // 2
+
+
+class ScenarioGenerator:
+    """Generates the scenario of each episode of a sweep.
+
+    The scenario of episode i only depends on the seed and on i, so
+    every agent type and configuration in a sweep is evaluated on the
+    same scenarios (common random numbers), and the differences between
+    them are not hidden by the differences between the scenarios.
+    """
+
+    def __init__(self, map: grid.Map, seed: int):
+        self._seed = seed
+        self._n_taxi_locations = map.n_taxi_positions
+        self._n_passenger_locations = map.n_passenger_positions
+
+    def scenario(self, episode: int) -> Scenario:
+        rng = np.random.default_rng([self._seed, episode])
+        return Scenario(
+            taxi_locations=rng.permutation(self._n_taxi_locations),
+            taxi_directions=rng.integers(4, size=self._n_taxi_locations),
+            passenger_locations=rng.permutation(self._n_passenger_locations),
+        )
+
+
+def draw(rng: np.random.Generator, map: grid.Map, n_taxis: int, n_passengers: int) -> Scenario:
+    """Draws a scenario with exactly n_taxis taxis and n_passengers passengers.
+
+    The locations are drawn without replacement, so no two taxis share
+    a location and no two passenger locations, pick-up or drop-off, are
+    the same. The draws are, in this order:
+
+        1. rng.choice(map.n_taxi_positions, n_taxis, replace=False)
+        2. rng.integers(4, size=n_taxis) for the taxi directions
+        3. rng.choice(map.n_passenger_positions, 2 * n_passengers, replace=False)
+           for the (pick-up, drop-off) pairs
+
+    Raises:
+        ValueError: if the map does not have enough locations.
+    """
+    if n_taxis > map.n_taxi_positions:
+        raise ValueError("Unable to create taxi: Not enough free locations.")
+    if 2 * n_passengers > map.n_passenger_positions:
+        raise ValueError("Unable to create passenger: Not enough free locations.")
+    return Scenario(
+        taxi_locations=rng.choice(map.n_taxi_positions, n_taxis, replace=False),
+        taxi_directions=rng.integers(4, size=n_taxis),
+        passenger_locations=rng.choice(map.n_passenger_positions, 2 * n_passengers, replace=False),
+    )
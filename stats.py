@@ -0,0 +1,142 @@
+import math
+import numpy as np
+import statistics
+
+from typing import Dict, List, Sequence, Tuple
+
+
+def z_value(confidence: float) -> float:
+    """Two-sided quantile of the normal distribution for a confidence level."""
+    if not 0 < confidence < 1:
+        raise ValueError(f"Confidence must be between 0 and 1: {confidence}")
+    return statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def t_value(confidence: float, dof: int) -> float:
+    """Two-sided quantile of the Student t distribution with dof degrees
+    of freedom for a confidence level.
+
+    The quantile is exact for 1 and 2 degrees of freedom and otherwise
+    computed with the Cornish-Fisher expansion around the normal
+    quantile (Abramowitz and Stegun 26.7.5), within 1% for 3 degrees
+    of freedom and much closer for more.
+    """
+    if dof < 1:
+        raise ValueError(f"Degrees of freedom must be positive: {dof}")
+    p = 0.5 + confidence / 2
+    z = z_value(confidence)
+    if dof == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if dof == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    g4 = (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160
+    return z + g1 / dof + g2 / dof ** 2 + g3 / dof ** 3 + g4 / dof ** 4
+
+
+def ci_half_width(values: Sequence[float], confidence: float = 0.95) -> float:
+    """Half-width of the Student t confidence interval for the mean of the
+    values, which holds for few values unlike the normal interval."""
+    values = np.asarray(values, dtype=float)
+    if len(values) < 2:
+        return np.inf
+    return t_value(confidence, len(values) - 1) * values.std(ddof=1) / np.sqrt(len(values))
+
+
+def paired_difference(a: Sequence[float], b: Sequence[float], confidence: float = 0.95) -> Tuple[float, float]:
+    """Mean and confidence interval half-width of the difference a - b.
+
+    The values must be paired, that is a[i] and b[i] measured under the
+    same conditions, such as the same scenario. The interval only
+    depends on the variance of the differences, which is much smaller
+    than the variance of each sample when the pairs are correlated.
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    if a.shape != b.shape:
+        raise ValueError(f"Paired samples must have the same length: {len(a)} and {len(b)}")
+    diff = a - b
+    return (float(diff.mean()) if len(diff) else np.nan), float(ci_half_width(diff, confidence))
+
+
+def unpaired_difference(a: Sequence[float], b: Sequence[float], confidence: float = 0.95) -> Tuple[float, float]:
+    """Mean and confidence interval half-width of the difference of the
+    means of two independent samples, with the Welch t interval."""
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    if len(a) < 2 or len(b) < 2:
+        return float(a.mean() - b.mean()) if len(a) and len(b) else np.nan, np.inf
+    va = a.var(ddof=1) / len(a)
+    vb = b.var(ddof=1) / len(b)
+    se = np.sqrt(va + vb)
+    if se == 0:
+        return float(a.mean() - b.mean()), 0.0
+    # Welch-Satterthwaite degrees of freedom, rounded down.
+    dof = (va + vb) ** 2 / (va ** 2 / (len(a) - 1) + vb ** 2 / (len(b) - 1))
+    return float(a.mean() - b.mean()), float(t_value(confidence, max(1, int(dof))) * se)
+
+
+class SequentialStopper:
+    """Decides when enough runs were performed to estimate some metrics.
+
+    Runs are added one at a time and the stopper is done when, for every
+    metric, the half-width of the confidence interval of the mean is at
+    most rel_tol times the absolute value of the mean, or when max_runs
+    runs were added. At least min_runs runs are always required.
+
+    The relative tolerance vanishes for metrics with a mean near zero,
+    such as the fraction of stalled episodes, so a half-width of at most
+    abs_tol is also accepted.
+    """
+
+    def __init__(
+        self,
+        metrics: Sequence[str],
+        rel_tol: float = 0.05,
+        abs_tol: float = 0.01,
+        min_runs: int = 10,
+        max_runs: int = 100,
+        confidence: float = 0.95,
+    ):
+        if min_runs < 2:
+            raise ValueError(f"At least 2 runs are required to estimate the confidence interval: {min_runs}")
+        if max_runs < min_runs:
+            raise ValueError(f"Maximum runs {max_runs} is lower than minimum runs {min_runs}")
+        self._metrics = list(metrics)
+        self._rel_tol = rel_tol
+        self._abs_tol = abs_tol
+        self._min_runs = min_runs
+        self._max_runs = max_runs
+        self._confidence = confidence
+        self._values: Dict[str, List[float]] = {m: [] for m in self._metrics}
+
+    @property
+    def n_runs(self) -> int:
+        return len(self._values[self._metrics[0]]) if self._metrics else 0
+
+    def add(self, run: Dict[str, float]):
+        """Adds the metrics of a run."""
+        for m in self._metrics:
+            self._values[m].append(run[m])
+
+    def intervals(self) -> Dict[str, Tuple[float, float]]:
+        """Mean and confidence interval half-width of each metric."""
+        return {
+            m: (float(np.mean(v)) if v else np.nan, ci_half_width(v, self._confidence))
+            for m, v in self._values.items()
+        }
+
+    @property
+    def converged(self) -> bool:
+        """Whether all the metrics are within the relative or absolute tolerance."""
+        if self.n_runs < self._min_runs:
+            return False
+        return all(
+            hw <= max(self._rel_tol * abs(mean), self._abs_tol) for mean, hw in self.intervals().values()
+        )
+
+    @property
+    def done(self) -> bool:
+        return self.n_runs >= self._max_runs or self.converged
@@ -0,0 +1,122 @@
+import grid
+import hashlib
+import json
+import numpy as np
+import os
+import typing
+
+from typing import Dict, Optional
+
+# Modules whose code changes the simulation results, including the
+# initial states, the maps and the episode loops. Results computed
+# with a different version of these are not reused.
+_CODE_MODULES = (
+    "agent.py", "entity.py", "env.py", "grid.py", "mapfile.py", "routing.py", "run.py", "scenario.py",
+)
+
+
+class Metrics(typing.NamedTuple):
+    """Metrics of a single episode, as stored in the metrics CSV files."""
+
+    taxi_distance: float
+    pick_up_time: float
+    drop_off_time: float
+    n_delivered: int
+    n_steps: int
+    # Whether the episode ended early because its state cycled. Older
+    # records without it did not detect stalls.
+    stalled: bool = False
+
+
+class ResultStore:
+    """Local store with the metrics of completed episodes.
+
+    Each configuration is identified by a key that hashes the agent
+    type, number of agents and passengers, map, seeds, stall window and
+    code version.
+    The episodes of a configuration are appended to a JSON lines file
+    as soon as they finish, so an interrupted sweep can be resumed
+    by skipping the episodes already in the store.
+    """
+
+    def __init__(self, directory: str = ".results"):
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def key(
+        self,
+        agent_type: str,
+        n_agents: int,
+        n_passengers: int,
+        map: grid.Map,
+        seed: Optional[int],
+        scenario_seed: Optional[int] = None,
+        stall_window: int = 0,
+    ) -> str:
+        """Computes the key for a configuration and saves its description."""
+        config = {
+            "agent_type": agent_type,
+            "n_agents": n_agents,
+            "n_passengers": n_passengers,
+            "map": map_hash(map),
+            "seed": seed,
+            "scenario_seed": scenario_seed,
+            "stall_window": stall_window,
+            "code_version": code_version(),
+        }
+        encoded = json.dumps(config, sort_keys=True)
+        key = hashlib.sha256(encoded.encode()).hexdigest()[:16]
+
+        config_path = os.path.join(self._directory, f"{key}.json")
+        if not os.path.exists(config_path):
+            with open(config_path, "w") as fp:
+                fp.write(encoded)
+        return key
+
+    def load(self, key: str) -> Dict[int, Metrics]:
+        """Loads the completed episodes for a configuration key."""
+        episodes = {}
+        path = self._episodes_path(key)
+        if not os.path.exists(path):
+            return episodes
+        with open(path, "r") as fp:
+            for line in fp:
+                # A partially written line means the process was killed
+                # while saving that episode, so it is recomputed.
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                episode = record.pop("episode")
+                episodes[episode] = Metrics(**record)
+        return episodes
+
+    def append(self, key: str, episode: int, metrics: Metrics):
+        """Persists the metrics of a completed episode."""
+        record = {"episode": episode, **metrics._asdict()}
+        with open(self._episodes_path(key), "a") as fp:
+            fp.write(json.dumps(record) + "\n")
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    def _episodes_path(self, key: str) -> str:
+        return os.path.join(self._directory, f"{key}.jsonl")
+
+
+def map_hash(map: grid.Map) -> str:
+    """Hashes the cells of a map."""
+    h = hashlib.sha256()
+    h.update(repr(map.road_mask.shape).encode())
+    # Same bytes as the Cell values, road 0 and sidewalk 1.
+    h.update((~map.road_mask).astype(np.uint8).tobytes())
+    return h.hexdigest()
+
+
+def code_version() -> str:
+    """Hashes the source of the modules that define the simulation."""
+    h = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in _CODE_MODULES:
+        with open(os.path.join(directory, name), "rb") as fp:
+            h.update(fp.read())
+    return h.hexdigest()
@@ -0,0 +1,167 @@
+import threading
+import time
+
+from typing import List, Optional, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+"""Content type of the Prometheus text format."""
+
+
+class Telemetry:
+    """Live counters of a sweep, exposed in the Prometheus text format.
+
+    The counters are plain attributes written only by the simulation
+    loop, and the server thread only reads them, so updates take no
+    locks and never wait for a scrape. A scrape may see the counters of
+    a step partially updated, which only shifts them by one step.
+
+    Attributes:
+        agent_type: label of the agents of the sweep.
+        episodes: number of completed episodes.
+        steps: number of environment steps.
+        act_seconds: time spent computing the actions.
+        step_seconds: time spent in the environment steps.
+        pool: agent pool whose worker utilisation is exposed, if any.
+    """
+
+    def __init__(self, agent_type: str):
+        self.agent_type = agent_type
+        self.episodes = 0
+        self.steps = 0
+        self.act_seconds = 0.0
+        self.step_seconds = 0.0
+        self.pool = None
+        self._started = time.perf_counter()
+
+        # Steps at the previous scrape, for the recent steps per second.
+        # Only used by the server thread.
+        self._last_scrape: Optional[Tuple[float, int]] = None
+
+    def record_step(self, act_seconds: float, step_seconds: float, n_steps: int = 1):
+        """Adds the time of n_steps steps, more than one when fast-forwarding."""
+        self.act_seconds += act_seconds
+        self.step_seconds += step_seconds
+        self.steps += n_steps
+
+    def record_episode(self):
+        self.episodes += 1
+
+    def render(self) -> str:
+        """Current values of the metrics in the Prometheus text format."""
+        now = time.perf_counter()
+        steps = self.steps
+        act_seconds = self.act_seconds
+        step_seconds = self.step_seconds
+
+        if self._last_scrape is None:
+            elapsed, recent_steps = now - self._started, steps
+        else:
+            elapsed, recent_steps = now - self._last_scrape[0], steps - self._last_scrape[1]
+        self._last_scrape = (now, steps)
+
+        label = f'agent_type="{_escape(self.agent_type)}"'
+        lines: List[str] = []
+        _metric(lines, "taxi_episodes_completed_total", "counter", "Completed episodes.", [("", self.episodes)])
+        _metric(lines, "taxi_steps_total", "counter", "Environment steps.", [("", steps)])
+        _metric(
+            lines, "taxi_steps_per_second", "gauge", "Environment steps per second since the previous scrape.",
+            [("", recent_steps / elapsed if elapsed > 0 else 0.0)],
+        )
+        _metric(
+            lines, "taxi_act_seconds_total", "counter", "Time spent computing the actions of all taxis.",
+            [(label, act_seconds)],
+        )
+        _metric(
+            lines, "taxi_act_seconds_mean", "gauge", "Mean time per step to compute the actions of all taxis.",
+            [(label, act_seconds / steps if steps else 0.0)],
+        )
+        _metric(lines, "taxi_env_step_seconds_total", "counter", "Time spent in environment steps.", [("", step_seconds)])
+        _metric(
+            lines, "taxi_env_step_seconds_mean", "gauge", "Mean duration of an environment step.",
+            [("", step_seconds / steps if steps else 0.0)],
+        )
+
+        pool = self.pool
+        if pool is not None:
+            wall = pool.wall_seconds
+            _metric(
+                lines, "taxi_worker_busy_seconds_total", "counter", "Time each agent worker spent computing actions.",
+                [(f'worker="{w}"', busy) for w, busy in enumerate(pool.busy_seconds)],
+            )
+            _metric(
+                lines, "taxi_worker_utilisation", "gauge", "Fraction of the act time each agent worker was busy.",
+                [(f'worker="{w}"', busy / wall if wall > 0 else 0.0) for w, busy in enumerate(pool.busy_seconds)],
+            )
+        return "\n".join(lines) + "\n"
+
+
+class TelemetryServer:
+    """Serves the telemetry metrics at /metrics from a daemon thread."""
+
+    def __init__(self, telemetry: Telemetry, port: int = 9100, host: str = "127.0.0.1"):
+        # Only imported when serving, as the counters are always imported by run.py.
+        import http.server
+
+        self._telemetry = telemetry
+        handler = _handler(telemetry)
+        self._server = http.server.ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="telemetry", daemon=True)
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._server.server_address[:2]
+
+    def start(self):
+        self._thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self) -> "TelemetryServer":
+        self.start()
+        return self
+
+    def __exit__(self, ex_type, ex_val, ex_traceback) -> bool:
+        self.close()
+        return False
+
+
+def _handler(telemetry: Telemetry):
+    import http.server
+
+    # A lock only between scrapes, as rendering updates the state of
+    # the previous scrape. The simulation loop never takes it.
+    lock = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            with lock:
+                body = telemetry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Requests would otherwise be printed over the progress bar.
+            pass
+
+    return Handler
+
+
+def _metric(lines: List[str], name: str, kind: str, help: str, samples: List[Tuple[str, float]]):
+    lines.append(f"# HELP {name} {help}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,190 @@
+import entity
+import enum
+import env
+import grid
+import numpy as np
+
+from typing import List, Optional, Sequence, Tuple
+
+
+class Channel(enum.IntEnum):
+    """Channels of the encoded observation.
+
+    Each channel is an (height, width) plane with 1 in the cells
+    where the feature is present and 0 elsewhere.
+    """
+
+    ROAD = 0
+    """Cells that are roads."""
+
+    TAXIS = 1
+    """Cells with at least one taxi."""
+
+    FREE_TAXIS = 2
+    """Cells with at least one taxi without a passenger."""
+
+    PICK_UPS = 3
+    """Pick-Up locations of the passengers waiting for a taxi."""
+
+    DROP_OFFS = 4
+    """Drop-Off locations of the passengers not yet delivered."""
+
+    OWN = 5
+    """Position of the observing taxi. Empty in fleet observations."""
+
+
+N_CHANNELS = len(Channel)
+
+ACTIONS: Tuple[env.Action, ...] = tuple(env.Action)
+"""Actions indexed by their value, to convert integer actions."""
+
+
+class Encoder:
+    """Encodes the environment state into a multi-channel uint8 array.
+
+    The channels are filled directly from the arrays of the taxi and
+    passenger stores. The array is allocated once and updated in place
+    at every call to encode, so callers that keep a reference to it
+    always see the latest observation. The road channel is only written
+    when the encoder is created and when the cells of the map change,
+    such as with road closures.
+
+    With per_agent=True the array has shape (taxis, channels, height, width)
+    and the OWN channel marks the position of each taxi. Otherwise it has
+    shape (channels, height, width) and describes the whole fleet.
+    """
+
+    def __init__(self, map: grid.Map, n_taxis: int, per_agent: bool = True, out: Optional[np.ndarray] = None):
+        self._n_taxis = n_taxis
+        self._per_agent = per_agent
+
+        shape = (N_CHANNELS, map.height, map.width)
+        if per_agent:
+            shape = (n_taxis, *shape)
+        if out is None:
+            out = np.zeros(shape, dtype=np.uint8)
+        elif out.shape != shape or out.dtype != np.uint8:
+            raise ValueError(f"Expected uint8 buffer with shape {shape} but got {out.dtype} {out.shape}")
+        self._buffer = out
+
+        self._buffer[..., Channel.ROAD, :, :] = map.road_mask
+        # Version of the map in the road channel, which is only written
+        # again when the cells change.
+        self._map_version = map.version
+
+        # The taxis positions are gathered into these arrays before
+        # being scattered into the buffer.
+        self._taxi_x = np.zeros(n_taxis, dtype=np.intp)
+        self._taxi_y = np.zeros(n_taxis, dtype=np.intp)
+        self._taxi_free = np.zeros(n_taxis, dtype=bool)
+
+    @property
+    def buffer(self) -> np.ndarray:
+        """Array updated in place by encode."""
+        return self._buffer
+
+    def encode(self, environment: env.Environment) -> np.ndarray:
+        """Writes the current state of the environment into the buffer."""
+        taxis = environment.taxi_store
+        if taxis.size != self._n_taxis:
+            raise ValueError(f"Encoder expects {self._n_taxis} taxis but environment has {taxis.size}.")
+
+        if environment.map.version != self._map_version:
+            self._buffer[..., Channel.ROAD, :, :] = environment.map.road_mask
+            self._map_version = environment.map.version
+
+        n = self._n_taxis
+        self._taxi_x[:] = taxis.x[:n]
+        self._taxi_y[:] = taxis.y[:n]
+        np.less(taxis.passenger[:n], 0, out=self._taxi_free)
+
+        passengers = environment.passenger_store
+        m = passengers.size
+        active = environment.active_passengers
+        in_trip = passengers.in_trip[:m]
+        waiting = active & (in_trip == entity.TripState.WAITING.value)
+        not_delivered = active & (in_trip != entity.TripState.FINISHED.value)
+
+        # The fleet channels are written in the first plane and then
+        # broadcast to the other agents.
+        fleet = self._buffer[0] if self._per_agent else self._buffer
+        fleet[Channel.TAXIS:].fill(0)
+        fleet[Channel.TAXIS, self._taxi_y, self._taxi_x] = 1
+        fleet[Channel.FREE_TAXIS, self._taxi_y[self._taxi_free], self._taxi_x[self._taxi_free]] = 1
+        fleet[Channel.PICK_UPS, passengers.pick_up_y[:m][waiting], passengers.pick_up_x[:m][waiting]] = 1
+        fleet[Channel.DROP_OFFS, passengers.drop_off_y[:m][not_delivered], passengers.drop_off_x[:m][not_delivered]] = 1
+
+        if self._per_agent:
+            self._buffer[1:, Channel.TAXIS:Channel.OWN] = fleet[Channel.TAXIS:Channel.OWN]
+            self._buffer[:, Channel.OWN].fill(0)
+            self._buffer[np.arange(self._n_taxis), Channel.OWN, self._taxi_y, self._taxi_x] = 1
+
+        return self._buffer
+
+
+class BatchedEnvironment:
+    """Steps several environments at once with array observations.
+
+    All the observations are stored in a single preallocated array with
+    shape (envs, taxis, channels, height, width), or (envs, channels,
+    height, width) for fleet observations, that is updated in place.
+
+    Environments that reach a terminal state are reset automatically
+    in the same step, so the returned observation is already the first
+    observation of the next episode.
+    """
+
+    def __init__(self, environments: Sequence[env.Environment], n_taxis: int, per_agent: bool = True):
+        if len(environments) == 0:
+            raise ValueError("At least one environment is required.")
+        self._environments = list(environments)
+        self._n_taxis = n_taxis
+
+        first = self._environments[0].map
+        shape = (N_CHANNELS, first.height, first.width)
+        if per_agent:
+            shape = (n_taxis, *shape)
+        self._observations = np.zeros((len(self._environments), *shape), dtype=np.uint8)
+        self._encoders = [
+            Encoder(e.map, n_taxis, per_agent=per_agent, out=self._observations[i])
+            for i, e in enumerate(self._environments)
+        ]
+        self._terminals = np.zeros(len(self._environments), dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self._environments)
+
+    @property
+    def environments(self) -> List[env.Environment]:
+        return self._environments
+
+    def reset(self) -> np.ndarray:
+        """Resets all the environments and returns their observations."""
+        for e, enc in zip(self._environments, self._encoders):
+            e.reset()
+            enc.encode(e)
+        self._terminals.fill(False)
+        return self._observations
+
+    def step(self, actions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Performs a step in all the environments.
+
+        Args:
+            actions: Integer array with shape (envs, taxis) with the
+                values of the actions to perform.
+
+        Returns: The observations array and a boolean array with the
+            environments that reached a terminal state in this step.
+        """
+        actions = np.asarray(actions)
+        expected = (len(self._environments), self._n_taxis)
+        if actions.shape != expected:
+            raise ValueError(f"Expected actions with shape {expected} but got {actions.shape}")
+
+        for i, (e, enc) in enumerate(zip(self._environments, self._encoders)):
+            _, terminal = e.step(*(ACTIONS[a] for a in actions[i]))
+            self._terminals[i] = terminal
+            if terminal:
+                e.reset()
+            enc.encode(e)
+        return self._observations, self._terminals